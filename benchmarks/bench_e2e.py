@@ -0,0 +1,123 @@
+"""End-to-end benchmark of YandexQuery against in-process YQ fake.
+
+Measures time from query submission to DataFrames, number of requests
+and bytes transferred for result sets of different sizes, network
+latencies and fault rates.
+
+Run from repository root:
+    python -m benchmarks.bench_e2e --rows 10000 100000 --latency 0 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from typing import Any, Optional
+from yandex_query_magic import YandexQuery, PollingPolicy, RetryPolicy
+from tests.fake_yq import FakeYandexQuery, FakeResultSet
+
+
+async def run_once(fake: FakeYandexQuery, query_text: str,
+                   executor: Optional[Executor] = None) -> dict[str, Any]:
+    polling_policy = PollingPolicy(initial_delay=0.05, max_delay=0.5)
+    retry_policy = RetryPolicy(attempts=10)
+
+    async with YandexQuery(**fake.urls(),
+                           polling_policy=polling_policy,
+                           retry_policy=retry_policy,
+                           conversion_executor=executor) as yq:
+        yq.set_service_account_key_auth(FakeYandexQuery.SA_KEY)
+        fake.reset_stats()
+
+        started = time.perf_counter()
+        query_id = await yq.start_execute_query("folder", query_text)
+        await yq.wait_results("folder", query_id,
+                              lambda _: None, lambda _, __: None)
+        results = await yq.get_query_result("folder", query_id)
+        fetched = time.perf_counter()
+
+        results.to_dataframes(None)
+        finished = time.perf_counter()
+
+        return {"total": finished - started,
+                "fetch": fetched - started,
+                "convert": finished - fetched,
+                "requests": fake.total_requests,
+                "bytes": fake.bytes_sent + fake.bytes_received,
+                "retries": yq.retry_stats.retries}
+
+
+def make_executor(kind: str) -> Optional[Executor]:
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=4)
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=4)
+    return None
+
+
+def bench(rows: int, latency: float, fault_rate: float,
+          repeat: int, executor: Optional[Executor] = None) -> dict[str, Any]:
+    with FakeYandexQuery(latency=latency,
+                         error_rate=fault_rate / 2,
+                         throttle_rate=fault_rate / 2) as fake:
+        query_text = f"select {rows} rows"
+        fake.add_query(query_text, [FakeResultSet.typed(rows)])
+
+        # warm up synthetic pages cache of the fake
+        asyncio.run(run_once(fake, query_text, executor))
+
+        runs = [asyncio.run(run_once(fake, query_text, executor))
+                for _ in range(repeat)]
+
+    result = {"rows": rows, "latency": latency, "faults": fault_rate}
+    for key in runs[0]:
+        result[key] = statistics.median(run[key] for run in runs)
+    return result
+
+
+def main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[1000, 100000])
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0],
+                        help="seconds added to every response")
+    parser.add_argument("--faults", type=float, nargs="+", default=[0.0],
+                        help="share of responses replaced with 429 or 500")
+    parser.add_argument("--executor", choices=["none", "thread", "process"],
+                        default="none",
+                        help="pool to convert pages in while downloading")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=str, default=None,
+                        help="file to write results to")
+    args = parser.parse_args(argv)
+
+    header = f"{'rows':>9} {'latency':>8} {'faults':>7} {'total,s':>8} "\
+             f"{'fetch,s':>8} {'convert,s':>9} {'requests':>8} "\
+             f"{'MB':>8} {'retries':>7}"
+    lines = [header]
+    print(header)
+    executor = make_executor(args.executor)
+    for rows in args.rows:
+        for latency in args.latency:
+            for faults in args.faults:
+                r = bench(rows, latency, faults, args.repeat, executor)
+                line = f"{r['rows']:>9} {r['latency']:>8} {r['faults']:>7} "\
+                       f"{r['total']:>8.3f} {r['fetch']:>8.3f} "\
+                       f"{r['convert']:>9.3f} {r['requests']:>8} "\
+                       f"{r['bytes'] / 1024 / 1024:>8.2f} "\
+                       f"{r['retries']:>7}"
+                lines.append(line)
+                print(line, flush=True)
+
+    if executor is not None:
+        executor.shutdown()
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
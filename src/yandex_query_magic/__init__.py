@@ -1,5 +1,14 @@
 from .main import YandexQuery, YandexQueryException  # noqa
+from .polling import PollingPolicy  # noqa
+from .retry_policy import RetryPolicy, CircuitBreakerOpenError  # noqa
+from .rate_limiter import RateLimiter  # noqa
+from .result_cache import ResultCache  # noqa
+from .checkpoints import PageCheckpoints  # noqa
+from .query_coalescing import QueryCoalescer  # noqa
+from .query_handle import QueryHandle  # noqa
+from .tracing import Tracer, CallbackTracer, OpenTelemetryTracer  # noqa
 from .yq_results import YandexQueryResults  # noqa
+from .parquet_results import ParquetResults  # noqa
 from .magics import *  # noqa
 from .sqltext_parser import SqlParser  # noqa
 from .jinja_template import JinjaTemplate  # noqa
@@ -0,0 +1,278 @@
+from __future__ import annotations
+import base64
+import binascii
+import functools
+import json
+from decimal import Decimal
+from typing import Any, Callable
+from .column_conversion import transpose
+from .query_results import YQResults
+from .yql_types import YqlType, parse_type, INT_TYPES, FLOAT_TYPES, \
+    TEXT_TYPES, DATETIME_TYPES
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except Exception as e:
+        raise ValueError("pyarrow must be installed to convert results "
+                         "to Arrow and Parquet: %pip install pyarrow") from e
+
+    return pyarrow
+
+
+Converter = Callable[[Any], Any]
+
+
+def _to_bytes(value: str) -> bytes:
+    # Arrow binary keeps bytes even if they are valid utf-8
+    return base64.b64decode(value)
+
+
+def _to_null(value: Any) -> None:
+    # Void value is encoded as "Void"
+    return None
+
+
+def _to_decimal(value: str) -> Decimal | None:
+    # special values, e.g inf, do not fit Arrow decimal and become null
+    decimal = YQResults._convert_from_decimal(value)
+    return decimal if decimal.is_finite() else None
+
+
+def _to_json(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+# Arrow types of primitive YQL types
+_PRIMITIVES: dict[str, str] = {
+    "Bool": "bool_",
+    "Int8": "int8", "Int16": "int16", "Int32": "int32", "Int64": "int64",
+    "Uint8": "uint8", "Uint16": "uint16", "Uint32": "uint32",
+    "Uint64": "uint64",
+    "Float": "float32", "Double": "float64",
+    "Utf8": "string", "Uuid": "string", "Json": "string",
+    "String": "binary",
+    "Date": "date32",
+    "Void": "null", "Null": "null",
+    "pgint2": "int16", "pgint4": "int32", "pgint8": "int64",
+    "pgfloat4": "float32", "pgfloat8": "float64",
+}
+
+# values of these types are converted differently from YQResults
+_ARROW_CONVERTERS: dict[str, Converter] = {
+    "String": _to_bytes,
+    "Void": _to_null,
+    "Null": _to_null,
+}
+
+
+def _primitive_converter(name: str) -> Converter:
+    converter = _ARROW_CONVERTERS.get(name, None)
+    return converter if converter is not None\
+        else YQResults._get_converter(name)
+
+
+def _to_optional(inner_converter: Converter) -> Converter:
+    # Optional value is encoded as [] for null or [value]
+    def convert_optional(value: list) -> Any:
+        return inner_converter(value[0]) if len(value) > 0 else None
+
+    return convert_optional
+
+
+def _to_list(inner_converter: Converter) -> Converter:
+    def convert_list(value: list) -> list:
+        return [inner_converter(v) for v in value]
+
+    return convert_list
+
+
+def _to_struct(names: tuple[str, ...],
+               inner_converters: list[Converter]) -> Converter:
+    # struct is encoded as list of member values
+    members = list(zip(names, inner_converters))
+
+    def convert_struct(value: list) -> dict:
+        return {name: converter(v)
+                for ((name, converter), v) in zip(members, value)}
+
+    return convert_struct
+
+
+def _to_map(key_converter: Converter, value_converter: Converter) -> Converter:
+    # dict is encoded as list of [key, value] pairs
+    def convert_map(value: list) -> list:
+        return [(key_converter(k), value_converter(v)) for k, v in value]
+
+    return convert_map
+
+
+def _arrow_converter(yql_type: YqlType) -> tuple[Any, Converter]:
+    pa = import_pyarrow()
+    name = yql_type.name
+
+    if name in _PRIMITIVES and len(yql_type.args) == 0:
+        return getattr(pa, _PRIMITIVES[name])(), _primitive_converter(name)
+
+    if name == "Datetime":
+        return pa.timestamp("s", tz="UTC"), _primitive_converter(name)
+
+    if name == "Timestamp":
+        return pa.timestamp("us", tz="UTC"), _primitive_converter(name)
+
+    if name == "Decimal" and len(yql_type.params) == 2:
+        precision, scale = yql_type.params
+        return pa.decimal128(precision, scale), _to_decimal
+
+    if name == "Enum":
+        return pa.string(), YQResults._convert_from_enum
+
+    if name == "Tagged":
+        return _arrow_converter(yql_type.args[0])
+
+    if name == "Optional":
+        arrow_type, inner_converter = _arrow_converter(yql_type.args[0])
+        return arrow_type, _to_optional(inner_converter)
+
+    if name in ["List", "Set"]:
+        arrow_type, inner_converter = _arrow_converter(yql_type.args[0])
+        return pa.list_(arrow_type), _to_list(inner_converter)
+
+    if name == "Struct" and len(yql_type.args) > 0:
+        inner = [_arrow_converter(t) for t in yql_type.args]
+        fields = [pa.field(member, arrow_type)
+                  for member, (arrow_type, _) in zip(yql_type.names, inner)]
+        return pa.struct(fields), _to_struct(yql_type.names,
+                                             [c for _, c in inner])
+
+    if name == "Dict":
+        (key_type, key_converter), (value_type, value_converter) = \
+            [_arrow_converter(t) for t in yql_type.args]
+        return pa.map_(key_type, value_type), _to_map(key_converter,
+                                                      value_converter)
+
+    return pa.string(), _to_json
+
+
+@functools.lru_cache(maxsize=1024)
+def arrow_column_type(yql_type: str) -> tuple[Any, Converter]:
+    """Returns Arrow type of YQL type and converter of raw JSON values
+    of that type to Python values accepted by pyarrow.
+    Types without Arrow counterpart are kept as JSON strings
+    """
+
+    pa = import_pyarrow()
+
+    try:
+        return _arrow_converter(parse_type(yql_type))
+    except (ValueError, IndexError):
+        return pa.string(), _to_json
+
+
+def _decode_base64(values: list[Any]) -> list[Any]:
+    return [None if value is None else binascii.a2b_base64(value)
+            for value in values]
+
+
+def _vectorised_array(yql_type: YqlType,
+                      arrow_type: Any,
+                      values: list[Any]) -> Any:
+    """Builds array from raw values with Arrow casts,
+    values are None for nulls.
+    :return: array or None if type is not supported
+    """
+
+    pa = import_pyarrow()
+    name = yql_type.name
+
+    # special values of Float and Double, e.g inf, are encoded as str,
+    # such columns fail here and are converted value by value
+    if name in INT_TYPES or name in FLOAT_TYPES or name in TEXT_TYPES\
+            or name == "Bool":
+        return pa.array(values, type=arrow_type)
+
+    if name == "String":
+        return pa.array(_decode_base64(values), type=arrow_type)
+
+    if name in DATETIME_TYPES or name == "Decimal":
+        return pa.array(values, type=pa.string()).cast(arrow_type)
+
+    return None
+
+
+def column_to_array(yql_type: str, values: list[Any]) -> Any:
+    """Converts column of raw YQ values to Arrow array.
+    Numbers, strings, dates and decimals are built with Arrow casts,
+    nulls of Optional columns are passed to Arrow as validity bitmap.
+    Other types are converted value by value
+    """
+
+    pa = import_pyarrow()
+    arrow_type, converter = arrow_column_type(yql_type)
+
+    try:
+        parsed = parse_type(yql_type)
+        if parsed.name == "Optional":
+            parsed = parsed.args[0]
+            if parsed.name == "Optional":
+                raise ValueError("Nested optional")
+
+            # Optional value is encoded as [] for null or [value]
+            inner_values = [value[0] if value else None for value in values]
+        else:
+            inner_values = values
+
+        array = _vectorised_array(parsed, arrow_type, inner_values)
+        if array is not None:
+            return array
+    except (ValueError, TypeError, OverflowError):
+        # e.g. wrong value of the type, pyarrow errors are subclasses
+        pass
+
+    return pa.array([converter(value) for value in values], type=arrow_type)
+
+
+def arrow_schema(columns: list[dict[str, str]]) -> Any:
+    """Returns Arrow schema of YQ result set columns"""
+
+    pa = import_pyarrow()
+    return pa.schema([pa.field(column["name"],
+                               arrow_column_type(column["type"])[0])
+                      for column in columns])
+
+
+def rows_to_record_batch(columns: list[dict[str, str]],
+                         rows: list[list[Any]],
+                         schema: Any = None) -> Any:
+    """Converts raw YQ rows to Arrow record batch"""
+
+    pa = import_pyarrow()
+    if schema is None:
+        schema = arrow_schema(columns)
+
+    data = transpose(rows, len(columns))
+    arrays = [column_to_array(column["type"], data[index])
+              for index, column in enumerate(columns)]
+
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def rows_to_table(columns: list[dict[str, str]], rows: list[list[Any]]) -> Any:
+    """Converts raw YQ rows to Arrow table"""
+
+    pa = import_pyarrow()
+    return pa.Table.from_batches([rows_to_record_batch(columns, rows)])
+
+
+def decimals_to_float(table: Any) -> Any:
+    """Casts decimal columns of Arrow table to float64"""
+
+    pa = import_pyarrow()
+    for index, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(index,
+                                     pa.field(field.name, pa.float64()),
+                                     table.column(index).cast(pa.float64()))
+
+    return table
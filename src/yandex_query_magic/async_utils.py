@@ -0,0 +1,10 @@
+import asyncio
+
+
+def retrieve_exception(future: asyncio.Future) -> None:
+    """Done callback marking exception of the future as retrieved,
+    so it is not logged when nobody awaits the future, e.g. shared
+    task left without callers or abandoned background work"""
+
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+from typing import Any, Optional
+
+
+class PageCheckpoints:
+    """On-disk store of downloaded result pages.
+
+    Each page is saved to <directory>/<query id>/ under its result set
+    index, offset and limit, so interrupted download of query results
+    can be resumed fetching only missing pages
+    """
+
+    def __init__(self, directory: str):
+        """
+        :directory directory to store pages in
+        """
+
+        self.directory = directory
+
+    def _query_dir(self, query_id: str) -> str:
+        return os.path.join(self.directory, query_id)
+
+    def _page_path(self, query_id: str,
+                   result_index: int, offset: int, limit: int) -> str:
+        return os.path.join(self._query_dir(query_id),
+                            f"{result_index}_{offset}_{limit}.json")
+
+    def load(self, query_id: str,
+             result_index: int, offset: int, limit: int) -> Optional[Any]:
+        """Returns saved raw page or None if it was not saved"""
+
+        path = self._page_path(query_id, result_index, offset, limit)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, query_id: str,
+             result_index: int, offset: int, limit: int, page: Any) -> None:
+        """Saves raw page"""
+
+        os.makedirs(self._query_dir(query_id), exist_ok=True)
+
+        path = self._page_path(query_id, result_index, offset, limit)
+        # written to temporary file first, so partially
+        # written page is never loaded
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(page, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def pages(self, query_id: str) -> int:
+        """Returns number of saved pages of the query"""
+
+        try:
+            return len([name for name in os.listdir(self._query_dir(query_id))
+                        if name.endswith(".json")])
+        except FileNotFoundError:
+            return 0
+
+    def remove(self, query_id: str, result_index: Optional[int] = None)\
+            -> None:
+        """Removes saved pages of the result set or all saved pages
+        of the query"""
+
+        if result_index is None:
+            shutil.rmtree(self._query_dir(query_id), ignore_errors=True)
+            return
+
+        prefix = f"{result_index}_"
+        try:
+            names = os.listdir(self._query_dir(query_id))
+        except FileNotFoundError:
+            return
+
+        for name in names:
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self._query_dir(query_id), name))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,263 @@
+from __future__ import annotations
+import binascii
+import functools
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Optional
+from .yql_types import YqlType, parse_type, INT_TYPES, FLOAT_TYPES, \
+    TEXT_TYPES, DATETIME_TYPES
+
+
+# converts whole column of raw values to array-like accepted by DataFrame
+ColumnConverter = Callable[[list[Any]], Any]
+
+# converts single raw value
+ValueConverter = Callable[[Any], Any]
+
+_STRING = "string"
+
+# pandas nullable dtypes of YQL types
+_NULLABLE_DTYPES = {
+    "Int8": "Int8", "Int16": "Int16", "Int32": "Int32", "Int64": "Int64",
+    "Uint8": "UInt8", "Uint16": "UInt16", "Uint32": "UInt32",
+    "Uint64": "UInt64", "Bool": "boolean", "Float": "Float32",
+    "Double": "Float64", "Utf8": _STRING, "Uuid": _STRING, "Json": _STRING,
+}
+
+DTYPE_BACKENDS = ("numpy_nullable", "pyarrow")
+
+
+@functools.lru_cache(maxsize=1)
+def _string_dtype() -> Any:
+    # string[pyarrow] if pyarrow is installed, python storage otherwise
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.StringDtype("python")
+    return pd.StringDtype("pyarrow")
+
+
+def transpose(rows: list[list[Any]], column_count: int) -> list[list[Any]]:
+    """Returns columns of rows"""
+
+    if len(rows) == 0:
+        return [[] for _ in range(0, column_count)]
+
+    return [list(column) for column in zip(*rows)]
+
+
+def _to_text(value: bytes) -> str | bytes:
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value
+
+
+def _convert_numbers(values: list[Any]) -> Any:
+    # the same dtype as pandas infers from python ints and bools
+    array = np.array(values)
+    return array if array.dtype.kind in "iub" else values
+
+
+def _convert_floats(values: list[Any]) -> Any:
+    # special values, e.g inf, are encoded as str
+    return np.array(values, dtype=np.float64)
+
+
+def _convert_strings(values: list[Any]) -> list[Any]:
+    decoded = list(map(binascii.a2b_base64, values))
+    try:
+        return list(map(bytes.decode, decoded))
+    except UnicodeDecodeError:
+        # not utf-8 values are kept as bytes
+        return list(map(_to_text, decoded))
+
+
+def _convert_datetimes(values: list[Any]) -> Any:
+    return pd.to_datetime(values, format="ISO8601")
+
+
+def _optional_converter(inner: YqlType,
+                        inner_converter: ColumnConverter,
+                        numeric: bool) -> ColumnConverter:
+    # Optional value is encoded as [] for null or [value]
+    datetimes = inner.name in DATETIME_TYPES
+
+    def convert(values: list[Any]) -> Any:
+        present = np.fromiter(map(len, values), dtype=np.int64,
+                              count=len(values)) > 0
+        if present.all():
+            return inner_converter([value[0] for value in values])
+
+        if not present.any():
+            return [None] * len(values)
+
+        if datetimes:
+            # None is converted to NaT
+            return inner_converter([value[0] if value else None
+                                    for value in values])
+
+        converted = inner_converter([value[0] for value in values if value])
+        if numeric:
+            # as pandas does for numbers with None
+            result = np.full(len(values), np.nan)
+            result[present] = converted
+            return result
+
+        result = [None] * len(values)
+        for index, value in zip(np.flatnonzero(present).tolist(),
+                                converted):
+            result[index] = value
+        return result
+
+    return convert
+
+
+def _vectorised(yql_type: YqlType,
+                decimal_as_float: bool) -> ColumnConverter | None:
+    name = yql_type.name
+
+    if name in INT_TYPES or name == "Bool":
+        return _convert_numbers
+
+    if name in FLOAT_TYPES or (name == "Decimal" and decimal_as_float):
+        return _convert_floats
+
+    if name == "String":
+        return _convert_strings
+
+    if name in DATETIME_TYPES:
+        return _convert_datetimes
+
+    if name in TEXT_TYPES:
+        return list
+
+    if name == "Optional":
+        inner = yql_type.args[0]
+        inner_converter = _vectorised(inner, decimal_as_float)
+        if inner_converter is not None and inner.name != "Optional":
+            numeric = inner.name in INT_TYPES or\
+                inner.name in FLOAT_TYPES or inner.name == "Decimal"
+            return _optional_converter(inner, inner_converter, numeric)
+
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def column_converter(column_type: str,
+                     value_converter: ValueConverter,
+                     decimal_as_float: bool = False) -> ColumnConverter:
+    """Returns converter of whole column of the type.
+    Numbers are converted with numpy, strings are decoded in bulk,
+    dates with pandas. Decimal is converted to float64 if
+    decimal_as_float is set. Other types are converted by value_converter
+    value by value
+    """
+
+    try:
+        converter = _vectorised(parse_type(column_type), decimal_as_float)
+    except ValueError:
+        converter = None
+
+    def convert(values: list[Any]) -> Any:
+        if len(values) == 0:
+            return values
+
+        if converter is not None:
+            try:
+                return converter(values)
+            except (ValueError, TypeError, OverflowError):
+                # e.g. dates out of pandas range
+                pass
+
+        # exotic types are converted value by value
+        return list(map(value_converter, values))
+
+    return convert
+
+
+def _nullable_converter(yql_type: YqlType,
+                        decimal_as_float: bool) -> Optional[ColumnConverter]:
+    optional = yql_type.name == "Optional"
+    inner = yql_type.args[0] if optional else yql_type
+    name = inner.name
+
+    def inner_values(values: list[Any]) -> list[Any]:
+        # Optional value is encoded as [] for null or [value]
+        if optional:
+            return [value[0] if value else None for value in values]
+        return values
+
+    if name in _NULLABLE_DTYPES:
+        dtype = _NULLABLE_DTYPES[name]
+        if dtype == _STRING:
+            dtype = _string_dtype()
+
+        def convert(values: list[Any]) -> Any:
+            return pd.array(inner_values(values), dtype=dtype)
+
+        return convert
+
+    if name == "String":
+        def convert(values: list[Any]) -> Any:
+            values = inner_values(values)
+            decoded = [None if value is None else binascii.a2b_base64(value)
+                       for value in values]
+            try:
+                return pd.array([None if value is None else value.decode()
+                                 for value in decoded],
+                                dtype=_string_dtype())
+            except UnicodeDecodeError:
+                # not utf-8 values are kept as bytes in object column
+                return [None if value is None else _to_text(value)
+                        for value in decoded]
+
+        return convert
+
+    if name in DATETIME_TYPES:
+        def convert(values: list[Any]) -> Any:
+            # None is converted to NaT, pandas 2 parses to ns
+            return _convert_datetimes(inner_values(values)).as_unit("us")
+
+        return convert
+
+    if name == "Decimal" and decimal_as_float:
+        def convert(values: list[Any]) -> Any:
+            return pd.array([None if value is None else float(value)
+                             for value in inner_values(values)],
+                            dtype="Float64")
+
+        return convert
+
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def nullable_column_converter(column_type: str,
+                              value_converter: ValueConverter,
+                              decimal_as_float: bool = False)\
+        -> ColumnConverter:
+    """Returns converter of whole column of the type to pandas
+    nullable array: Int64, UInt32, boolean, Float64, string[pyarrow] and
+    datetime64[us] columns, nulls are kept as NA.
+    Decimal is converted to Float64 if decimal_as_float is set.
+    Other types are converted by value_converter value by value
+    """
+
+    try:
+        converter = _nullable_converter(parse_type(column_type),
+                                        decimal_as_float)
+    except ValueError:
+        converter = None
+
+    def convert(values: list[Any]) -> Any:
+        if converter is not None:
+            try:
+                return converter(values)
+            except (ValueError, TypeError, OverflowError):
+                # e.g. dates out of pandas range
+                pass
+
+        return list(map(value_converter, values))
+
+    return convert
@@ -0,0 +1,40 @@
+import sys
+import dateutil.parser
+from datetime import datetime, timezone
+from typing import Optional
+
+
+if sys.version_info >= (3, 11):
+    # parses all formats YQ emits: 2020-01-01, 2020-01-01T10:00:00Z,
+    # 2020-01-01T10:00:00.123456Z and pg 2020-01-01 10:00:00
+    _fromisoformat = datetime.fromisoformat
+else:
+    def _fromisoformat(value: str) -> datetime:
+        # fromisoformat of python 3.10 does not accept Z suffix
+        if value.endswith("Z"):
+            return datetime.fromisoformat(value[:-1])\
+                .replace(tzinfo=timezone.utc)
+        return datetime.fromisoformat(value)
+
+
+def parse_datetime(value: str) -> datetime:
+    """Parses date or timestamp as returned by YQ.
+    Unexpected formats are parsed with dateutil"""
+
+    try:
+        return _fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.isoparse(value)
+
+
+def parse_datetimes(values: list[Optional[str]]) -> list[Optional[datetime]]:
+    """Parses column of dates or timestamps as returned by YQ,
+    None values are kept"""
+
+    try:
+        return list(map(_fromisoformat, values))
+    except (ValueError, TypeError, AttributeError):
+        # nulls or unexpected formats, python 3.10 wrapper raises
+        # AttributeError on nulls
+        return [None if value is None else parse_datetime(value)
+                for value in values]
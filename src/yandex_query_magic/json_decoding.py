@@ -0,0 +1,202 @@
+import json
+import re
+from typing import Any
+
+
+class JsonDecoder:
+    """Decodes JSON responses of YQ API with standard json module"""
+
+    name = "json"
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonDecoder(JsonDecoder):
+    """Decodes JSON with orjson. Documents orjson rejects,
+    e.g. with NaN literals, are decoded with json module"""
+
+    name = "orjson"
+
+    def __init__(self):
+        try:
+            import orjson
+        except Exception as e:
+            raise ValueError("orjson must be installed to use "
+                             "OrjsonDecoder: %pip install orjson") from e
+
+        self._orjson = orjson
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return self._orjson.loads(data)
+        except self._orjson.JSONDecodeError:
+            return json.loads(data)
+
+
+class MsgspecDecoder(JsonDecoder):
+    """Decodes JSON with msgspec"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        try:
+            import msgspec
+        except Exception as e:
+            raise ValueError("msgspec must be installed to use "
+                             "MsgspecDecoder: %pip install msgspec") from e
+
+        self._decoder = msgspec.json.Decoder()
+        self._error = msgspec.DecodeError
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._error:
+            return json.loads(data)
+
+
+def default_json_decoder() -> JsonDecoder:
+    """Returns the fastest available decoder:
+    orjson, msgspec or standard json module"""
+
+    for decoder in [OrjsonDecoder, MsgspecDecoder]:
+        try:
+            return decoder()
+        except ValueError:
+            pass
+
+    return JsonDecoder()
+
+
+class BufferedParser:
+    """Collects response body and decodes it at once"""
+
+    def __init__(self, decoder: JsonDecoder):
+        self.decoder = decoder
+        self._chunks: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+
+    def close(self) -> Any:
+        body = b"".join(self._chunks)
+        self._chunks = []
+        return self.decoder.loads(body) if body else None
+
+
+# string (possibly not terminated yet) or bracket,
+# other tokens of document head do not change nesting
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*("?)|[\[\]{}]', re.DOTALL)
+_KEY_SEPARATOR = re.compile(rb'\s*:\s*')
+_ROWS_KEY = b'"rows"'
+_OPEN = frozenset(b"[{")
+_QUOTE = ord('"')
+
+
+class RowsStreamParser:
+    """Decodes result page while it is being received.
+
+    Rows of the top level "rows" array are decoded in batches as soon as
+    they are complete, so full body is never held in memory.
+    The rest of the document, e.g. columns, is decoded when body ends.
+    Rows are expected to be arrays, as YQ encodes them
+    """
+
+    def __init__(self, decoder: JsonDecoder):
+        self.decoder = decoder
+        self.rows: list[Any] = []
+
+        self._buffer = b""
+        self._pos = 0  # position in buffer scanned already
+        self._depth = 0
+        self._head = b""
+        self._in_rows = False
+
+    def feed(self, chunk: bytes) -> None:
+        self._buffer = self._buffer + chunk if self._buffer else chunk
+        if not self._in_rows:
+            self._scan_head()
+        if self._in_rows:
+            self._scan_rows()
+
+    def _scan_head(self) -> None:
+        buffer = self._buffer
+        depth = self._depth
+        pos = len(buffer)
+        for m in _TOKEN.finditer(buffer, self._pos):
+            start = m.start()
+            if buffer[start] == _QUOTE:
+                if not m.group(1):
+                    pos = start  # string continues in next chunk
+                    break
+
+                if depth != 1 or buffer[start:m.end()] != _ROWS_KEY:
+                    continue
+
+                separator = _KEY_SEPARATOR.match(buffer, m.end())
+                if separator is None:
+                    if buffer[m.end():].strip():
+                        continue  # "rows" is a value, not a key
+
+                    pos = start  # separator is in next chunk
+                    break
+
+                value = separator.end()
+                if value >= len(buffer):
+                    pos = start  # value is in next chunk
+                    break
+
+                if buffer[value] == ord("["):
+                    self._head = buffer[:value]
+                    self._buffer = buffer[value + 1:]
+                    self._pos = 0
+                    self._depth = 0
+                    self._in_rows = True
+                    return
+            elif buffer[start] in _OPEN:
+                depth += 1
+            else:
+                depth -= 1
+
+        self._pos = pos
+        self._depth = depth
+
+    def _scan_rows(self) -> None:
+        # Last "]," is the end of a row unless it is inside string, nested
+        # array or closes rows array. In these cases rows before it do not
+        # form valid JSON array, so they are decoded later
+        buffer = self._buffer
+        row_end = buffer.rfind(b"],")
+        if row_end < 0:
+            return
+
+        rows = buffer[:row_end + 1].lstrip(b", \t\r\n")
+        try:
+            self.rows.extend(self.decoder.loads(b"[" + rows + b"]"))
+        except ValueError:
+            return
+
+        self._buffer = buffer[row_end + 1:]
+
+    def close(self) -> Any:
+        body = self._buffer
+        self._buffer = b""
+
+        if not self._in_rows:
+            # no rows array, e.g. error response
+            return self.decoder.loads(body) if body else None
+
+        # remaining rows, end of rows array and the rest of document
+        document = self.decoder.loads(self._head + b"[" +
+                                      body.lstrip(b", \t\r\n"))
+        document["rows"][:0] = self.rows
+        return document
+
+
+def make_parser(decoder: JsonDecoder,
+                incremental: bool = False) -> BufferedParser | RowsStreamParser:  # noqa: E501
+    """Returns parser of one response body"""
+
+    return RowsStreamParser(decoder) if incremental\
+        else BufferedParser(decoder)
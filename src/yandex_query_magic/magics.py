@@ -1,6 +1,10 @@
 import os
 
 from .main import YandexQuery, YandexQueryException
+from .yq_results import YandexQueryResults
+from .parquet_results import ParquetResults
+from .result_cache import ResultCache
+from .checkpoints import PageCheckpoints
 import argparse
 from IPython.core.magic_arguments import (argument,
                                           magic_arguments,
@@ -16,7 +20,7 @@ import asyncio
 import ipywidgets as widgets
 from datetime import datetime
 from .jinja_template import JinjaTemplate
-from typing import Optional, Dict
+from typing import Any, Optional, Dict
 from .ipythondisplay import IpythonDisplay
 import nest_asyncio
 import json
@@ -31,6 +35,59 @@ class YQMagics(Magics):
 
     DefaultFolderId = None  # default folder to be used between queries
     Sa_info = None  # authentication token to be used between queries
+    CacheEnabled = False  # use local results cache by default
+    Cache: Optional[ResultCache] = None  # local results cache
+    CheckpointDir = None  # directory to save downloaded result pages
+    CoalesceQueries = False  # share execution of identical running queries
+    Client: Optional[YandexQuery] = None  # shared, keeps connection pool
+    WarmUpTask: Optional[asyncio.Task] = None  # background auth pre-warming
+
+    @staticmethod
+    def get_result_cache() -> ResultCache:
+        if YQMagics.Cache is None:
+            YQMagics.Cache = ResultCache()
+
+        return YQMagics.Cache
+
+    @staticmethod
+    def get_yandex_query() -> YandexQuery:
+        """Returns YandexQuery shared between queries
+        configured with current settings"""
+
+        if YQMagics.Client is None:
+            YQMagics.Client = YandexQuery()
+
+        yq = YQMagics.Client
+        if YQMagics.Sa_info is not None:
+            yq.set_service_account_key_auth(YQMagics.Sa_info)
+        else:
+            yq.set_vm_auth()
+
+        yq.checkpoints = None if YQMagics.CheckpointDir is None\
+            else PageCheckpoints(YQMagics.CheckpointDir)
+        yq.coalesce_queries = YQMagics.CoalesceQueries
+        return yq
+
+    @staticmethod
+    def _warm_up() -> None:
+        """Obtains IAM token, VM folder id if needed and opens connection
+        to YQ in background, so the next query does not wait for them"""
+
+        resolve_folder_id = YQMagics.DefaultFolderId is None and\
+            YQMagics.Sa_info is None
+        yq = YQMagics.get_yandex_query()
+
+        async def warm_up():
+            try:
+                await yq.warm_up(resolve_folder_id)
+            except Exception:
+                # the query will report the problem if it persists
+                pass
+
+        # Jupyter kernel loop is running, so warm up proceeds after
+        # the cell is completed
+        loop = asyncio.get_event_loop()
+        YQMagics.WarmUpTask = loop.create_task(warm_up())
 
     def __init__(self, shell):
         Magics.__init__(self, shell=shell)
@@ -43,13 +100,11 @@ class YQMagics(Magics):
                                name: Optional[str] = None,
                                description: Optional[str] = None,
                                as_dataframe: bool = True,
-                               all_results: bool = False) -> None:
+                               all_results: bool = False,
+                               use_cache: Optional[bool] = None,
+                               parquet_dir: Optional[str] = None) -> None:
 
-        yq = YandexQuery()
-        if YQMagics.Sa_info is not None:
-            yq.set_service_account_key_auth(YQMagics.Sa_info)
-        else:
-            yq.set_vm_auth()
+        yq = YQMagics.get_yandex_query()
 
         variable = None
 
@@ -71,7 +126,7 @@ class YQMagics(Magics):
 
         if folder_id is None:
             try:
-                folder_id = await YandexQuery().resolve_vm_folder_id()
+                folder_id = await yq.resolve_vm_folder_id()
             except:
                 pass
 
@@ -81,6 +136,29 @@ class YQMagics(Magics):
                   "--folder-id <folder_id> extension")
             return
 
+        # Parquet files are the results artifact, they are not cached
+        if parquet_dir is not None:
+            use_cache = False
+        elif use_cache is None:
+            use_cache = YQMagics.CacheEnabled
+
+        result_cache = YQMagics.get_result_cache() if use_cache else None
+        if result_cache is not None:
+            cached_results = result_cache.get(folder_id, query_text)
+            if cached_results is not None:
+                cache_status = widgets.Label(
+                    "Results are taken from local cache. "
+                    "Use --no-cache to execute the query")
+                several_datasets_label = YQMagics._several_datasets_label()
+                display(widgets.VBox([cache_status, several_datasets_label]))
+
+                return self._return_results(
+                    YandexQueryResults(cached_results),
+                    variable,
+                    as_dataframe,
+                    all_results,
+                    several_datasets_label)
+
         # We use rich interaction with UI and async query execution
         # so we need to run asyncio loops when we need it and interrupt it
         # in required places
@@ -101,9 +179,7 @@ class YQMagics(Magics):
         is_truncated_label.style.text_color = 'violet'
 
         # shows only first dataset information
-        several_datasets_label = widgets.Label("")
-        several_datasets_label.style.text_color = 'violet'
-        several_datasets_label.layout.display = 'none'
+        several_datasets_label = YQMagics._several_datasets_label()
 
         # aborts execution of the query
         abort_query_button = widgets.Button(description="Abort")
@@ -184,16 +260,11 @@ class YQMagics(Magics):
         result = None
         try:
             # Start query execution
-            await yq.wait_results(
-                    folder_id,
-                    query_id,
-                    update_status,
-                    update_progress)
+            await query_id.wait(update_status, update_progress)
 
             try:
-                query_info = await yq.get_queryinfo(
-                                folder_id,
-                                query_id)
+                # requested once, reused for results download
+                query_info = await query_id.info()
 
                 query_status = query_info["status"]
                 progress.description = query_status
@@ -207,8 +278,29 @@ class YQMagics(Magics):
 
                 # Retrieving query results
                 try:
-                    if query_status == "COMPLETED":
-                        result = await yq.get_query_result(folder_id, query_id)
+                    if query_status == "COMPLETED" and parquet_dir is not None:
+                        result = await query_id.results_to_parquet(
+                            parquet_dir)
+
+                        progress.description = "DONE"
+                        progress.bar_style = "success"
+
+                    elif query_status == "COMPLETED":
+                        result = await query_id.results(lazy=True)
+
+                        # only the first result set is displayed
+                        # unless all of them are requested or cached
+                        if all_results or not as_dataframe or\
+                                result_cache is not None:
+                            await result.fetch()
+                        elif result.result_set_count > 0:
+                            await result.fetch(0)
+
+                        if result_cache is not None:
+                            result_cache.put(folder_id,
+                                             query_text,
+                                             result.raw_results)
+
                         progress.description = "DONE"
                         progress.bar_style = "success"
 
@@ -240,18 +332,43 @@ class YQMagics(Magics):
         stop_status.value = f"Finished at {finish_time_str}."\
                             f" Total time is {total_time}"
 
-        if result is not None:
+        return self._return_results(result,
+                                    variable,
+                                    as_dataframe,
+                                    all_results,
+                                    several_datasets_label)
+
+    @staticmethod
+    def _several_datasets_label() -> widgets.Label:
+        several_datasets_label = widgets.Label("")
+        several_datasets_label.style.text_color = 'violet'
+        several_datasets_label.layout.display = 'none'
+        return several_datasets_label
+
+    # Converts results as requested and writes them to external variable
+    def _return_results(self,
+                        result: Optional[YandexQueryResults | ParquetResults],
+                        variable: Optional[str],
+                        as_dataframe: bool,
+                        all_results: bool,
+                        several_datasets_label: widgets.Label) -> Any:
+
+        if isinstance(result, ParquetResults):
+            # lazy handle is returned as is, results may not fit in memory
+            pass
+        elif result is not None:
             if as_dataframe:
-                result = result.to_dataframes(None)
-                if not all_results:
-                    if isinstance(result, list):
-                        if len(result) > 1:
-                            several_datasets_label.value = f"{len(result)} result sets returned. Displaying first one. " \
-                                                            "Use --all-results to get all result sets"
-                            several_datasets_label.layout.display = 'block'
-
-                        if len(result) >= 1:
-                            result = result[0]
+                if all_results:
+                    result = result.to_dataframes(None)
+                else:
+                    if result.result_set_count > 1:
+                        several_datasets_label.value = \
+                            f"{result.result_set_count} result sets " \
+                            "returned. Displaying first one. " \
+                            "Use --all-results to get all result sets"
+                        several_datasets_label.layout.display = 'block'
+
+                    result = result.to_dataframes(0)
             else:
                 result = result.raw_results
 
@@ -269,6 +386,9 @@ class YQMagics(Magics):
     @argument("--vm-auth", help="Authenticate use VM credentials", action="store_true")  # noqa
     @argument("--env-auth", help="Authenticate using credentials from environment variable", type=str)  # noqa
     @argument("--folder-id", help="Yandex cloud folder id to run queries", type=str)  # noqa
+    @argument("--checkpoint-dir", help="Directory to save downloaded result pages to resume failed downloads", type=str)  # noqa
+    @argument("--coalesce-queries", help="Attach identical query to the running one instead of starting new execution", action="store_true")  # noqa
+    @argument("--no-coalesce-queries", help="Always start new execution of the query", action="store_true")  # noqa
     def yq_settings(self, line):
         args = parse_argstring(self.yq_settings, line)
 
@@ -276,15 +396,15 @@ class YQMagics(Magics):
             loop = asyncio.get_event_loop()
 
             async def resolve_vm():
-                await YandexQuery().resolve_vm_folder_id()
+                await YQMagics.get_yandex_query().resolve_vm_folder_id()
 
             try:
-                loop.run_until_complete(resolve_vm)
+                loop.run_until_complete(resolve_vm())
             except:
                 self.ipython_display.error(f"Cannot connect to VM cloud agent")
                 return
 
-            YQMagics.SA_info = None
+            YQMagics.Sa_info = None
         # read file with SA credentials
         elif args.sa_file_auth is not None:
             sa_file = args.sa_file_auth.strip()
@@ -306,6 +426,60 @@ class YQMagics(Magics):
         if args.folder_id is not None:
             YQMagics.DefaultFolderId = args.folder_id
 
+        if args.checkpoint_dir is not None:
+            YQMagics.CheckpointDir = args.checkpoint_dir
+
+        if args.coalesce_queries:
+            YQMagics.CoalesceQueries = True
+        elif args.no_coalesce_queries:
+            YQMagics.CoalesceQueries = False
+
+        YQMagics._warm_up()
+
+    @no_var_expand
+    @line_magic
+    @magic_arguments()
+    @argument("--enable", help="Use local results cache for all queries", action="store_true")  # noqa
+    @argument("--disable", help="Use local results cache only for queries with --cache", action="store_true")  # noqa
+    @argument("--dir", help="Cache directory", type=str)  # noqa
+    @argument("--ttl", help="Seconds to keep cached results", type=float)  # noqa
+    @argument("--max-size-mb", help="Maximum cache size in megabytes", type=float)  # noqa
+    @argument("--clear", help="Remove all cached results", action="store_true")  # noqa
+    def yq_cache(self, line):
+        args = parse_argstring(self.yq_cache, line)
+
+        if args.dir is not None:
+            cache = YQMagics.get_result_cache()
+            YQMagics.Cache = ResultCache(args.dir.strip(),
+                                         cache.ttl,
+                                         cache.max_size)
+
+        cache = YQMagics.get_result_cache()
+        if args.ttl is not None:
+            cache.ttl = args.ttl
+
+        if args.max_size_mb is not None:
+            cache.max_size = int(args.max_size_mb * 1024 * 1024)
+            cache.evict()
+
+        if args.clear:
+            cache.clear()
+
+        if args.enable:
+            YQMagics.CacheEnabled = True
+        elif args.disable:
+            YQMagics.CacheEnabled = False
+
+        stats = cache.stats()
+        print(f"Cache is {'enabled' if YQMagics.CacheEnabled else 'disabled'}"
+              f" for all queries, directory {stats['directory']}\n"
+              f"Entries: {stats['entries']}, "
+              f"size: {stats['size'] / 1024 / 1024:.1f} MB "
+              f"of {cache.max_size / 1024 / 1024:.1f} MB, "
+              f"ttl: {cache.ttl} seconds\n"
+              f"Hits: {stats['hits']}, misses: {stats['misses']}, "
+              f"hit rate: {stats['hit_rate']:.1%}")
+
     @no_var_expand
     @magic_arguments()
     @line_cell_magic("yq")
@@ -316,6 +490,9 @@ class YQMagics(Magics):
     @argument("--no-var-expansion", help="Disable {{var}} evaluation", action="store_true")  # noqa
     @argument("--all-results", help="Return all results, not only first", action="store_true")  # noqa
     @argument("--raw-results", help="Return result as raw YQ response", action='store_true', default=False)  # noqa
+    @argument("--cache", help="Take results from local cache if the same query was executed recently", action="store_true")  # noqa
+    @argument("--no-cache", help="Do not use local results cache", action="store_true")  # noqa
+    @argument("--parquet", help="Write results to Parquet files in the directory and return lazy handle to them", type=str)  # noqa
     @argument("rest", nargs=argparse.REMAINDER)
     def execute(self, line: Optional[str] = None,
                 cell: Optional[str] = None) -> None:
@@ -339,6 +516,12 @@ class YQMagics(Magics):
             parser = SqlParser()
             query = parser.reformat(query, user_ns)
 
+        use_cache = None
+        if args.cache:
+            use_cache = True
+        elif args.no_cache:
+            use_cache = False
+
         loop = asyncio.get_event_loop()
 
         query_result = loop.run_until_complete(
@@ -346,7 +529,9 @@ class YQMagics(Magics):
                                   query, args.name,
                                   args.description,
                                   not args.raw_results,
-                                  args.all_results))
+                                  args.all_results,
+                                  use_cache,
+                                  args.parquet))
 
         return query_result
 
@@ -1,15 +1,29 @@
 from __future__ import print_function
+import contextlib
+import os
 import time
 import jwt
 from urllib.parse import urljoin
 import asyncio
 import aiohttp
-import dateutil.parser
 from enum import Enum
 from .yq_results import YandexQueryResults
-from typing import Optional, Callable, Any, Dict
-from aiohttp_retry import RandomRetry, RetryClient
-from datetime import datetime
+from .query_results import YQResults, convert_rows
+from .ttl_cache import TtlCache
+from .async_utils import retrieve_exception
+from .polling import PollingPolicy
+from .retry_policy import RetryPolicy, CircuitBreaker, RetryStats
+from .tracing import Tracer, Span
+from .checkpoints import PageCheckpoints
+from .rate_limiter import RateLimiter
+from .query_coalescing import QueryCoalescer
+from .query_handle import QueryHandle
+from .parquet_results import ParquetPageWriter, ParquetResults
+from .datetime_decoding import parse_datetime
+from .json_decoding import JsonDecoder, default_json_decoder, make_parser
+from typing import Optional, Callable, Any, AsyncIterator, Awaitable, Dict, Hashable, Tuple  # noqa: E501
+from concurrent.futures import Executor
+from datetime import datetime, timezone
 
 
 class YandexQueryException(Exception):
@@ -25,77 +39,381 @@ class YandexQueryException(Exception):
 class YandexQuery:
     """Execute queries in YQ"""
 
+    # Maximum number of rows in one results page (as YQ current limit)
+    RESULTS_PAGE_SIZE = 1000
+
+    # IAM tokens are shared between all instances within the process
+    token_cache = TtlCache()
+
+    # VM folder id does not change, but VM may be moved to another folder
+    VM_METADATA_TTL = 3600
+
+    # VM metadata lookups are shared between all instances
+    # within the process, they are not refreshed in background
+    vm_metadata_cache = TtlCache(default_ttl=VM_METADATA_TTL,
+                                 refresh_before_expiry=0)
+
+    # API call rates are limited for all instances within the process,
+    # limits are disabled until set with rate_limiter.set_rate
+    rate_limiter = RateLimiter()
+
+    # identical queries running concurrently within the process
+    # share one execution when coalescing is enabled
+    coalescer = QueryCoalescer()
+
     def __init__(self,
                  base_api_url: str = "https://api.yandex-query.cloud.yandex.net/api/",  # noqa: E501
                  base_iam_url: str = "https://iam.api.cloud.yandex.net",
-                 base_vm_metadata_url: str = "http://169.254.169.254/computeMetadata/v1/"):  # noqa: E501
+                 base_vm_metadata_url: str = "http://169.254.169.254/computeMetadata/v1/",  # noqa: E501
+                 connection_limit: int = 100,
+                 connection_limit_per_host: int = 0,
+                 dns_cache_ttl: Optional[int] = 300,
+                 keepalive_timeout: float = 60,
+                 max_concurrent_fetches: int = 8,
+                 polling_policy: Optional[PollingPolicy] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 tracer: Optional[Tracer] = None,
+                 json_decoder: Optional[JsonDecoder] = None,
+                 incremental_decoding: bool = False,
+                 checkpoint_dir: Optional[str] = None,
+                 coalesce_queries: bool = False,
+                 conversion_executor: Optional[Executor] = None):
+        """
+        :connection_limit total number of simultaneous connections
+        :connection_limit_per_host number of simultaneous connections
+        to one host, 0 for no limit
+        :dns_cache_ttl seconds to cache resolved addresses, None to cache
+        forever
+        :keepalive_timeout seconds to keep idle connection open
+        :max_concurrent_fetches number of result pages to download
+        simultaneously
+        :polling_policy delays between query status checks,
+        PollingPolicy.interactive() by default
+        :retry_policy timeouts and retries of HTTP calls
+        :tracer receives spans of HTTP requests and execution stages,
+        tracing is disabled by default
+        :json_decoder decoder of responses, orjson or msgspec
+        if installed by default
+        :incremental_decoding decodes rows of result pages while
+        they are being received instead of buffering whole pages
+        :checkpoint_dir directory to save downloaded result pages to,
+        so failed download of results is resumed from missing pages
+        :coalesce_queries attach identical query (same folder and text
+        up to whitespace) to the running one instead of starting new
+        execution, and download results of one query once for all callers.
+        Do not enable it for queries changing data
+        :conversion_executor thread or process pool to convert pages of
+        results in while next pages are being downloaded, by default
+        results are converted after download on first access
+        """
         self.service_account_key = None
         self.base_api_url = base_api_url
         self.base_iam_url = base_iam_url
         self.base_vm_metadata_url = base_vm_metadata_url
         self.auth_type = YandexQuery.AuthType.VM
 
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.polling_policy = PollingPolicy.interactive()\
+            if polling_policy is None else polling_policy
+        self.retry_policy = RetryPolicy()\
+            if retry_policy is None else retry_policy
+
+        self.circuit_breaker = CircuitBreaker(
+            self.retry_policy.failure_threshold,
+            self.retry_policy.reset_timeout)
+        self.retry_stats = RetryStats()
+        self.tracer = Tracer() if tracer is None else tracer
+        self.json_decoder = default_json_decoder()\
+            if json_decoder is None else json_decoder
+        self.incremental_decoding = incremental_decoding
+        self.checkpoints = None if checkpoint_dir is None\
+            else PageCheckpoints(checkpoint_dir)
+        self.coalesce_queries = coalesce_queries
+        self.conversion_executor = conversion_executor
+
+        # HTTP client with connection pool, created on first request
+        self._client: Optional[aiohttp.ClientSession] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self) -> "YandexQuery":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Closes pooled connections.
+        The instance is still usable, new pool is created on next request"""
+
+        client = self._client
+        self._client = None
+        self._client_loop = None
+
+        if client is not None:
+            await client.close()
+
     # https://cloud.yandex.ru/ru/docs/compute/operations/vm-info/get-info
-    async def _resolve_vm_account_key(self) -> str:
-        """Resolves IAM token in current VM"""
+    async def _resolve_vm_account_key(self) -> Tuple[str, Optional[float]]:
+        """Resolves IAM token in current VM
+           :return: token and its lifetime in seconds
+        """
 
         url = urljoin(self.base_vm_metadata_url, 'instance/service-accounts/default/token')  # noqa: E501
         headers = {'Metadata-Flavor': 'Google'}
 
-        async with await self.create_async_session(headers=headers) as session:
-            async with session.get(url, raise_for_status=True) as response:
-                resp = await response.json()
-                return resp["access_token"]
+        resp = await self._request("auth", "GET", url, headers=headers)
+        return resp["access_token"], resp.get("expires_in", None)
 
     # https://cloud.yandex.ru/ru/docs/compute/operations/vm-info/get-info
     async def resolve_vm_folder_id(self) -> str:
-        """Resolves IAM token in current VM"""
+        """Resolves folder id of current VM.
+        Folder id is cached within the process for VM_METADATA_TTL seconds
+        """
+
+        async def fetch() -> Tuple[str, Optional[float]]:
+            return await self._fetch_vm_folder_id(), None
+
+        return await YandexQuery.vm_metadata_cache.get(
+            ("folder_id", self.base_vm_metadata_url), fetch)
 
+    async def _fetch_vm_folder_id(self) -> str:
         url = urljoin(self.base_vm_metadata_url, 'instance/vendor/?recursive=true')  # noqa: E501
         headers = {'Metadata-Flavor': 'Google'}
 
-        async with await self.create_async_session(headers=headers) as session:
-            async with session.get(url, raise_for_status=True) as response:
-                resp = await response.json()
-                return resp["folderId"]
+        resp = await self._request("auth", "GET", url, headers=headers)
+        return resp["folderId"]
+
+    async def warm_up(self, resolve_folder_id: bool = False) -> None:
+        """Obtains IAM token and opens connection to YQ API in advance,
+        so the first query does not wait for them
+        :resolve_folder_id also resolve and cache folder id of current VM
+        """
+
+        warm_ups = [self._get_iam_token(), self._open_api_connection()]
+        if resolve_folder_id:
+            warm_ups.append(self.resolve_vm_folder_id())
+
+        await YandexQuery._gather(warm_ups)
+
+    async def _open_api_connection(self) -> None:
+        # connection is kept in the pool whatever the response is
+        timeout = aiohttp.ClientTimeout(total=self.retry_policy.timeout("info"))  # noqa: E501
+        async with self._get_client().head(self.base_api_url,
+                                           timeout=timeout) as response:
+            await response.read()
 
     # https://cloud.yandex.com/en/docs/iam/operations/iam-token/create-for-sa#get-iam-token
-    async def _resolve_service_account_key(self, sa_info: Dict[str, str]) -> str:
-        """Resolves IAM tokey by service account key"""
-
-        async with await self.create_async_session() as session:
-            api = urljoin(self.base_iam_url, "iam/v1/tokens")
-
-            now = int(time.time())
-            payload = {
-                    'aud': api,
-                    'iss': sa_info["service_account_id"],
-                    'iat': now,
-                    'exp': now + 360}
-
-            # Creating the JWT token
-            encoded_token = jwt.encode(
-                payload,
-                sa_info["private_key"],
-                algorithm='PS256',
-                headers={'kid': sa_info["id"]})
-
-            data = {"jwt": encoded_token}
-
-            async with session.post(api,
-                                    json=data,
-                                    raise_for_status=True) as response:
-                resp = await response.json()
-                return resp["iamToken"]
+    async def _resolve_service_account_key(self, sa_info: Dict[str, str]) -> Tuple[str, Optional[float]]:  # noqa: E501
+        """Resolves IAM tokey by service account key
+           :return: token and its lifetime in seconds
+        """
+
+        api = urljoin(self.base_iam_url, "iam/v1/tokens")
+
+        now = int(time.time())
+        payload = {
+                'aud': api,
+                'iss': sa_info["service_account_id"],
+                'iat': now,
+                'exp': now + 360}
+
+        # Creating the JWT token
+        encoded_token = jwt.encode(
+            payload,
+            sa_info["private_key"],
+            algorithm='PS256',
+            headers={'kid': sa_info["id"]})
+
+        data = {"jwt": encoded_token}
+
+        resp = await self._request("auth", "POST", api, json=data)
+
+        ttl = None
+        if "expiresAt" in resp:
+            expires_at = parse_datetime(resp["expiresAt"])
+            ttl = (expires_at - datetime.now(timezone.utc)).total_seconds()
+
+            # already expired token is not cached,
+            # next call requests new one
+            ttl = max(ttl, 0)
+
+        return resp["iamToken"], ttl
+
+    def _auth_identity(self) -> Hashable:
+        """Key of IAM token cache for current auth settings"""
+
+        if self.auth_type == YandexQuery.AuthType.VM:
+            return (YandexQuery.AuthType.VM, self.base_vm_metadata_url)
+        else:
+            return (YandexQuery.AuthType.SA_KEY_FILE,
+                    self.base_iam_url,
+                    self.service_account_key["service_account_id"],
+                    self.service_account_key["id"])
 
     async def _get_iam_token(self) -> str:
-        """Obtains new IAM account"""
+        """Obtains IAM token, cached one if it is still valid"""
 
         if self.auth_type == YandexQuery.AuthType.VM:
-            return await self._resolve_vm_account_key()
+            async def resolve():
+                return await self._resolve_vm_account_key()
         else:
-            return await self._resolve_service_account_key(
-                self.service_account_key)
+            sa_info = self.service_account_key
+
+            async def resolve():
+                return await self._resolve_service_account_key(sa_info)
+
+        async def fetch():
+            with self.tracer.span("yq.iam",
+                                  {"yq.auth_type": self.auth_type.name}):
+                return await resolve()
+
+        return await YandexQuery.token_cache.get(self._auth_identity(), fetch)
+
+    def _invalidate_iam_token(self, iam_token: Optional[str] = None) -> None:
+        """Drops IAM token from cache, e.g. when server rejected it"""
+
+        YandexQuery.token_cache.invalidate(self._auth_identity(), iam_token)
+
+    async def _call_api(self,
+                        operation: str,
+                        method: str,
+                        url: str,
+                        iam_token: Optional[str] = None,
+                        **kwargs) -> Any:
+        """Calls YQ API method authenticated with IAM token.
+        If token is rejected with 401, it is dropped from the cache
+        and the call is repeated once with a new token
+        :operation kind of the call to choose timeout and retries
+        :return: parsed json response
+        """
+
+        if iam_token is None:
+            iam_token = await self._get_iam_token()
+
+        for attempt in range(2):
+            headers = YandexQuery.get_request_url_header_params(iam_token)
+            try:
+                return await self._request(operation, method, url,
+                                           headers=headers, **kwargs)
+            except aiohttp.ClientResponseError as ex:
+                if ex.status == 401 and attempt == 0:
+                    self._invalidate_iam_token(iam_token)
+                    iam_token = await self._get_iam_token()
+                    continue
+
+                raise
+
+    # errors of the connection or transfer, worth to retry
+    RETRIABLE_EXCEPTIONS = (asyncio.TimeoutError,
+                            aiohttp.ClientConnectionError,
+                            aiohttp.ClientPayloadError)
+
+    async def _request(self,
+                       operation: str,
+                       method: str,
+                       url: str,
+                       **kwargs) -> Any:
+        """Performs HTTP request with timeout and retries
+        according to retry policy
+        :return: parsed json response
+        """
+
+        incremental = self.incremental_decoding and operation == "results"
+
+        with self.tracer.span("yq.http", {"yq.operation": operation,
+                                          "http.method": method}) as span:
+            parser, received = await self._read_with_retries(
+                operation, method, url, span,
+                lambda: make_parser(self.json_decoder, incremental),
+                **kwargs)
+
+        # with incremental decoding most of rows are decoded already
+        attributes = {"yq.operation": operation,
+                      "yq.bytes": received,
+                      "yq.decoder": self.json_decoder.name,
+                      "yq.incremental": incremental}
+        with self.tracer.span("yq.json_decode", attributes):
+            return parser.close()
+
+    async def _read_with_retries(self,
+                                 operation: str,
+                                 method: str,
+                                 url: str,
+                                 span: Span,
+                                 new_parser: Callable[[], Any],
+                                 **kwargs) -> Tuple[Any, int]:
+        """Reads response body retrying the request
+        according to retry policy
+        :new_parser creates parser of response body for each attempt
+        :return: parser fed with response body and body size
+        """
+
+        policy = self.retry_policy
+        stats = self.retry_stats
+        timeout = aiohttp.ClientTimeout(total=policy.timeout(operation))
+
+        self.circuit_breaker.check()
+
+        attempt = 0
+        rate_limit_wait = 0.0
+        while True:
+            attempt += 1
+
+            # retries pass the limiter too, so they do not add to overload
+            waited = await YandexQuery.rate_limiter.acquire(operation)
+            if waited > 0:
+                rate_limit_wait += waited
+                span.set_attribute("yq.rate_limit_wait", rate_limit_wait)
+
+            stats.requests += 1
+            span.set_attribute("yq.retries", attempt - 1)
+            received = 0
+            retry_after = None
+            try:
+                async with self._get_client().request(method, url,
+                                                      timeout=timeout,
+                                                      **kwargs) as response:
+                    span.set_attribute("http.status_code", response.status)
+
+                    parser = new_parser()
+                    async for chunk in response.content.iter_any():
+                        received += len(chunk)
+                        parser.feed(chunk)
+
+                    span.set_attribute("yq.bytes", received)
+
+                    if not policy.should_retry_status(operation,
+                                                      response.status):
+                        response.raise_for_status()
+                        self.circuit_breaker.record_success()
+                        return parser, received
+
+                    if attempt >= policy.attempts:
+                        self.circuit_breaker.record_failure()
+                        stats.failures += 1
+                        response.raise_for_status()
+
+                    retry_after = response.headers.get("Retry-After", None)
+
+            except YandexQuery.RETRIABLE_EXCEPTIONS as ex:
+                retriable = operation not in\
+                    RetryPolicy.NOT_IDEMPOTENT_OPERATIONS or\
+                    isinstance(ex, aiohttp.ClientConnectorError)
+
+                if not retriable or attempt >= policy.attempts:
+                    self.circuit_breaker.record_failure()
+                    stats.failures += 1
+                    stats.wasted_bytes += received
+                    raise
+
+            # response is thrown away
+            stats.retries += 1
+            stats.wasted_bytes += received
+            await asyncio.sleep(policy.backoff(attempt, retry_after))
 
     @staticmethod
     def get_request_url_header_params(
@@ -131,49 +449,93 @@ class YandexQuery:
                                   folder_id: str,
                                   query_text: Optional[str] = None,
                                   name: Optional[str] = None,
-                                  description: Optional[str] = None) -> str:
-        """Executing query in YQ using current settings
-           :return: query id
+                                  description: Optional[str] = None) -> QueryHandle:  # noqa: E501
+        """Executing query in YQ using current settings.
+           With coalescing identical running query is reused
+           :return: handle of the query, str equal to query id
         """
 
+        if self.coalesce_queries:
+            query_id = await YandexQuery.coalescer.submit(
+                folder_id,
+                query_text,
+                lambda: self._submit_query(folder_id,
+                                           query_text,
+                                           name,
+                                           description))
+        else:
+            query_id = await self._submit_query(folder_id,
+                                                query_text,
+                                                name,
+                                                description)
+
+        self.query_id = QueryHandle(query_id, self, folder_id)
+        return self.query_id
+
+    async def _submit_query(self,
+                            folder_id: str,
+                            query_text: Optional[str],
+                            name: Optional[str],
+                            description: Optional[str]) -> str:
         type = "ANALYTICS"
 
-        iam_token = await self._get_iam_token()
-        async with await self.create_async_session(iam_token) as session:
-            data = {"name": name,
-                    "type": type,
-                    "text": query_text,
-                    "description": description}
-
-            url = urljoin(self.base_api_url, f"fq/v1/queries?project={folder_id}") # noqa
-            async with session.post(url,
-                                    json=data,
-                                    raise_for_status=True) as response:
-                resp = await response.json()
-                self.query_id = resp["id"]
+        data = {"name": name,
+                "type": type,
+                "text": query_text,
+                "description": description}
 
-        return self.query_id
+        url = urljoin(self.base_api_url, f"fq/v1/queries?project={folder_id}") # noqa
+        with self.tracer.span("yq.submit", {"yq.folder_id": folder_id}):
+            resp = await self._call_api("submit", "POST", url, json=data)
+
+        return resp["id"]
+
+    def _get_client(self) -> aiohttp.ClientSession:
+        """Returns pooled HTTP client of this instance"""
 
-    async def create_async_session(self,
-                                   iam_token: Optional[str] = None,
-                                   headers: Optional[dict[str, str]] = None)\
-            -> RetryClient:
-        """Creates retriable asyncio session"""
+        loop = asyncio.get_running_loop()
 
-        headers = YandexQuery.get_request_url_header_params(iam_token, headers)
-        session = aiohttp.ClientSession(headers=headers,
-                                        timeout=aiohttp.ClientTimeout(total=1))
+        # aiohttp session can not be used outside of its event loop,
+        # e.g. when the instance is reused between notebook cells
+        # run with different loops, so it is recreated
+        if self._client is not None and self._client_loop is not loop:
+            YandexQuery._close_client(self._client, self._client_loop, loop)
+            self._client = None
 
-        retriable_exceptions = {
-            asyncio.exceptions.TimeoutError,
-            asyncio.TimeoutError
-            }
+        if self._client is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout)
 
-        retry_options = RandomRetry(attempts=3,
-                                    exceptions=retriable_exceptions)
+            self._client = aiohttp.ClientSession(
+                connector=connector,
+                headers=YandexQuery.get_request_url_header_params())
+            self._client_loop = loop
 
-        client = RetryClient(session, retry_options=retry_options)
-        return client
+        return self._client
+
+    @staticmethod
+    def _close_client(client: aiohttp.ClientSession,
+                      client_loop: asyncio.AbstractEventLoop,
+                      loop: asyncio.AbstractEventLoop) -> None:
+        """Closes pooled client created in other event loop"""
+
+        if client.closed:
+            return
+
+        if client_loop.is_closed():
+            # connections are gone with the loop,
+            # client is only marked closed, so it can be done in any loop
+            loop.create_task(client.close())
+        elif client_loop.is_running():
+            # loop of other thread
+            asyncio.run_coroutine_threadsafe(client.close(), client_loop)
+        else:
+            # connections are closed when the loop runs again
+            client_loop.create_task(client.close())
 
     async def _get_query_status(self, folder_id: str, query_id: str) -> str:
         """Retrieves the query status
@@ -183,42 +545,73 @@ class YandexQuery:
         url = urljoin(self.base_api_url,
                       f"fq/v1/queries/{query_id}/status?project={folder_id}")
 
-        iam_token = await self._get_iam_token()
-        async with await self.create_async_session(iam_token) as session:
-            async with session.get(url, raise_for_status=True) as response:
-                resp = await response.json()
-                return resp["status"]
+        resp = await self._call_api("status", "GET", url)
+        return resp["status"]
 
     async def wait_results(self,
                            folder_id: str,
                            query_id: str,
                            on_status_update: Callable[[str], None],
-                           on_progress_update: Callable[[int, datetime], None]) -> Optional[str]:  # noqa
+                           on_progress_update: Callable[[int, datetime], None],  # noqa
+                           polling_policy: Optional[PollingPolicy] = None,
+                           started_at: Optional[datetime] = None) -> str:
         """Wait the query to complete i.e. any status other
         than RUNNING. PENDING
-        Reports current status and progress while waiting"""
-
-        progress = 0
-        query_info = await self.get_queryinfo(folder_id,
-                                              query_id,
-                                              await self._get_iam_token())
+        Reports current status and progress while waiting
+        :polling_policy delays between status checks,
+        instance polling policy by default
+        :started_at time reported with progress, naive UTC.
+        Query start time is requested from query information if not set
+        :return: final status
+        """
 
-        started = dateutil.parser.isoparse(query_info["meta"]["started_at"])\
-            .replace(tzinfo=None)
+        if polling_policy is None:
+            polling_policy = self.polling_policy
 
-        while True:
-            status = await self._get_query_status(folder_id, query_id)
-            on_status_update(status)
-            if status not in ["RUNNING", "PENDING"]:
-                progress = 100
-                on_progress_update(progress, started)
-                return
-
-            await asyncio.sleep(1)
-            progress = progress+1
-            on_progress_update(progress, started)
-            if progress > 100:
+        with self.tracer.span("yq.wait", {"yq.query_id": query_id}) as span:
+            try:
                 progress = 0
+                wait_started = time.monotonic()
+                if started_at is None:
+                    query_info = await self.get_queryinfo(folder_id, query_id)
+                    started_at = parse_datetime(
+                        query_info["meta"]["started_at"]).replace(tzinfo=None)
+                started = started_at
+
+                delays = polling_policy.delays()
+                polls = 0
+                while True:
+                    status = await self._get_query_status(folder_id, query_id)
+                    polls += 1
+                    span.set_attribute("yq.polls", polls)
+                    on_status_update(status)
+                    if status not in ["RUNNING", "PENDING"]:
+                        YandexQuery.coalescer.finish(query_id)
+                        progress = 100
+                        on_progress_update(progress, started)
+                        return status
+
+                    delay = next(delays)
+                    if polling_policy.deadline is not None:
+                        remaining = polling_policy.deadline -\
+                            (time.monotonic() - wait_started)
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError(
+                                f"Query {query_id} is not completed "
+                                f"in {polling_policy.deadline} seconds")
+
+                        delay = min(delay, remaining)
+
+                    await asyncio.sleep(delay)
+                    progress = progress+1
+                    on_progress_update(progress, started)
+                    if progress > 100:
+                        progress = 0
+            except BaseException:
+                # failed or cancelled wait must not leave the query
+                # attachable, later identical query starts a new one
+                YandexQuery.coalescer.forget(query_id)
+                raise
 
     # https://cloud.yandex.com/en/docs/query/api/methods/get-query
     async def get_queryinfo(self,
@@ -229,71 +622,342 @@ class YandexQuery:
             when query execution is finished already
             :return:
         """
-        if iam_token is None:
-            iam_token = await self._get_iam_token()
-
-        async with await self.create_async_session(iam_token) as session:
-            url = urljoin(self.base_api_url,
-                          f"fq/v1/queries/{query_id}?project={folder_id}")
+        url = urljoin(self.base_api_url,
+                      f"fq/v1/queries/{query_id}?project={folder_id}")
 
-            async with session.get(url, raise_for_status=True) as response:
-                resp = await response.json()
-                return resp
+        return await self._call_api("info", "GET", url, iam_token)
 
     # https://cloud.yandex.com/en/docs/query/api/methods/get-query-results
+    async def _fetch_result_page(self,
+                                 folder_id: str,
+                                 query_id: str,
+                                 result_index: int,
+                                 offset: int,
+                                 limit: int = RESULTS_PAGE_SIZE,
+                                 iam_token: Optional[str] = None) -> Any:
+        """Retrieves one page of query execution results
+        :return: raw page with columns and rows
+        """
+
+        url = urljoin(self.base_api_url,
+                      f"fq/v1/queries/{query_id}/"
+                      f"results/{result_index}"
+                      f"?project={folder_id}&"
+                      f"limit={limit}&offset={offset}")
+
+        return await self._call_api("results", "GET", url, iam_token)
+
+    async def _fetch_result_set(self,
+                                folder_id: str,
+                                query_id: str,
+                                result_index: int,
+                                row_count: Optional[int],
+                                semaphore: asyncio.Semaphore,
+                                iam_token: Optional[str] = None)\
+            -> Tuple[dict[str, Any], Optional[list[Any]]]:
+        """Retrieves all pages of one result set.
+        If row count is known, all pages are requested concurrently,
+        otherwise they are read one by one until incomplete page.
+        With conversion executor each page is converted in it
+        while next pages are being downloaded
+        :return: raw result set with columns and rows,
+        converted rows if conversion executor is set
+        """
+
+        limit = YandexQuery.RESULTS_PAGE_SIZE
+
+        checkpoints = self.checkpoints
+        executor = self.conversion_executor
+        loop = asyncio.get_running_loop()
+        conversions: dict[int, asyncio.Future] = {}
+
+        async def fetch_page(offset: int) -> Any:
+            page = await download_page(offset)
+            if executor is not None:
+                conversions[offset] = loop.run_in_executor(executor,
+                                                           convert_rows,
+                                                           page)
+            return page
+
+        async def download_page(offset: int) -> Any:
+            if checkpoints is not None:
+                page = await asyncio.to_thread(checkpoints.load, query_id,
+                                               result_index, offset, limit)
+                if page is not None:
+                    return page
+
+            async with semaphore:
+                page = await self._fetch_result_page(folder_id,
+                                                     query_id,
+                                                     result_index,
+                                                     offset,
+                                                     limit,
+                                                     iam_token)
+
+            if checkpoints is not None:
+                await asyncio.to_thread(checkpoints.save, query_id,
+                                        result_index, offset, limit, page)
+
+            return page
+
+        try:
+            if row_count is not None:
+                # at least one page is required to get columns
+                offsets = range(0, max(row_count, 1), limit)
+                pages = await YandexQuery._gather([fetch_page(offset)
+                                                   for offset in offsets])
+            else:
+                pages = []
+                offset = 0
+                while True:
+                    page = await fetch_page(offset)
+                    pages.append(page)
+
+                    if len(page["rows"]) != limit:
+                        break
+                    else:
+                        offset += limit
+
+            converted_pages = None
+            if executor is not None:
+                converted_pages = await asyncio.gather(
+                    *[conversions[offset] for offset in sorted(conversions)])
+        finally:
+            # conversions are not left running if download fails
+            for conversion in conversions.values():
+                conversion.cancel()
+                conversion.add_done_callback(retrieve_exception)
+
+        rows = []
+        for page in pages:
+            rows.extend(page["rows"])
+
+        converted_rows = None
+        if converted_pages is not None:
+            converted_rows = []
+            for page_rows in converted_pages:
+                converted_rows.extend(page_rows)
+
+        return {"rows": rows, "columns": pages[0]["columns"]}, converted_rows
+
+    @staticmethod
+    def _row_count(result_set: dict[str, Any]) -> Optional[int]:
+        """Returns row count of result set description from query info,
+        None if it is unknown"""
+
+        row_count = result_set.get("rows_count", result_set.get("rows"))
+        return None if row_count is None else int(row_count)
+
+    @staticmethod
+    async def _gather(coros: list[Awaitable[Any]]) -> list[Any]:
+        """Runs coroutines concurrently, returns results in the same order.
+        If any coroutine fails, others are cancelled"""
+
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
     async def _query_results(self,
                              folder_id: str,
                              query_id: str,
                              result_set_count: int,
-                             iam_token: str) -> YandexQueryResults:
-        """Retrieves query execution results
+                             iam_token: Optional[str] = None,
+                             result_sets: Optional[list[Any]] = None)\
+            -> YandexQueryResults:
+        """Retrieves query execution results.
+        With checkpoint directory pages saved by previous failed attempt
+        are not downloaded again, saved pages are removed on success
         :result_set_count Maximum result set count to retrieve
+        :result_sets Result set descriptions from query info. If row
+        counts are known, pages of all result sets are fetched concurrently
         :return: YandexQueryResults wrapper over raw results
         """
-        results = list()
-
-        async with await self.create_async_session(iam_token) as session:
 
-            # reading results page by page with maximum page size = 1000
-            # (as YQ current limit)
-            for result_index in range(0, result_set_count):
-                limit = 1000
-                offset = 0
+        # pages are read with maximum page size = 1000 (as YQ current limit)
+        # limiting number of simultaneous requests
+        semaphore = asyncio.Semaphore(self.max_concurrent_fetches)
+
+        fetches = []
+        for result_index in range(0, result_set_count):
+            row_count = None
+            if result_sets is not None and result_index < len(result_sets):
+                row_count = YandexQuery._row_count(
+                    result_sets[result_index])
+
+            fetches.append(self._fetch_result_set(folder_id,
+                                                  query_id,
+                                                  result_index,
+                                                  row_count,
+                                                  semaphore,
+                                                  iam_token))
+
+        with self.tracer.span("yq.fetch_results",
+                              {"yq.query_id": query_id,
+                               "yq.result_sets": result_set_count}) as span:
+            fetched = await YandexQuery._gather(fetches)
+            results = [result for result, _ in fetched]
+            span.set_attribute("yq.rows",
+                               sum(len(rs["rows"]) for rs in results))
+
+        if self.checkpoints is not None:
+            await asyncio.to_thread(self.checkpoints.remove, query_id)
+
+        converted = None
+        if self.conversion_executor is not None:
+            converted = [rows for _, rows in fetched]
+
+        return YandexQueryResults(results,
+                                  tracer=self.tracer,
+                                  converted_rows=converted)
+
+    def _lazy_query_results(self,
+                            folder_id: str,
+                            query_id: str,
+                            result_sets: list[Any]) -> YandexQueryResults:
+        """Returns results fetching each result set on first access"""
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_fetches)
+
+        async def load(result_index: int)\
+                -> Tuple[dict[str, Any], Optional[list[Any]]]:
+            row_count = YandexQuery._row_count(result_sets[result_index])
+            with self.tracer.span("yq.fetch_results",
+                                  {"yq.query_id": query_id,
+                                   "yq.result_index": result_index}) as span:
+                fetched = await self._fetch_result_set(folder_id,
+                                                       query_id,
+                                                       result_index,
+                                                       row_count,
+                                                       semaphore)
+                span.set_attribute("yq.rows", len(fetched[0]["rows"]))
+
+            if self.checkpoints is not None:
+                await asyncio.to_thread(self.checkpoints.remove,
+                                        query_id,
+                                        result_index)
+
+            return fetched
+
+        return YandexQueryResults([None] * len(result_sets),
+                                  tracer=self.tracer,
+                                  loader=load)
+
+    async def iter_result_pages(self,
+                                folder_id: str,
+                                query_id: str,
+                                result_index: int = 0,
+                                prefetch: int = 2,
+                                raw: bool = False)\
+            -> AsyncIterator[tuple[list[Any], list[Any]]]:
+        """Streams one result set page by page without keeping
+        the whole result in memory.
+        Pages are downloaded in background, but no more than prefetch
+        pages are kept waiting for the consumer
+        :prefetch number of downloaded pages to keep ahead of consumer
+        :raw yield rows as returned by YQ, without conversion
+        :return: async iterator over (columns, rows) of each page
+        """
 
-                columns = None
-                rows = []
+        limit = YandexQuery.RESULTS_PAGE_SIZE
+        pages: asyncio.Queue = asyncio.Queue(maxsize=max(prefetch, 1))
 
+        async def download():
+            try:
+                offset = 0
                 while True:
-                    url = urljoin(self.base_api_url,
-                                  f"fq/v1/queries/{query_id}/"
-                                  f"results/{result_index}"
-                                  f"?project={folder_id}&"
-                                  f"limit={limit}&offset={offset}")
-
-                    async with session.get(url, raise_for_status=True)\
-                            as response:
-
-                        qresults = await response.json()
-                        if columns is None:
-                            columns = qresults["columns"]
-
-                        rows.extend(qresults["rows"])
-
-                        if len(qresults["rows"]) != limit:
-                            break
-                        else:
-                            offset += limit
+                    page = await self._fetch_result_page(folder_id,
+                                                         query_id,
+                                                         result_index,
+                                                         offset,
+                                                         limit)
+                    # blocks while consumer is behind
+                    await pages.put(page)
+
+                    if len(page["rows"]) != limit:
+                        break
+                    else:
+                        offset += limit
+
+                await pages.put(None)
+            except Exception as ex:
+                await pages.put(ex)
+
+        downloader = asyncio.ensure_future(download())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    return
+
+                if isinstance(page, Exception):
+                    raise page
+
+                if raw:
+                    yield page["columns"], page["rows"]
+                else:
+                    yield page["columns"], YQResults(page).results["rows"]
+        finally:
+            downloader.cancel()
+
+    async def get_query_result(self,
+                               folder_id: str,
+                               query_id: str,
+                               query_info: Optional[dict[str, Any]] = None,
+                               lazy: bool = False) -> Any:
+        """Retrieves all query results.
+        With coalescing concurrent calls for the same query share
+        one download
+        :query_info information of the finished query if already known,
+        requested otherwise
+        :lazy fetch each result set on first access instead of all
+        of them at once, the client must not be closed until then
+        """
 
-                results.append({"rows": rows, "columns": columns})
+        YandexQuery.coalescer.finish(query_id)
+        if self.coalesce_queries:
+            return await YandexQuery.coalescer.results(
+                query_id,
+                lambda: self._get_query_result(folder_id,
+                                               query_id,
+                                               query_info,
+                                               lazy))
+
+        return await self._get_query_result(folder_id,
+                                            query_id,
+                                            query_info,
+                                            lazy)
+
+    async def _get_query_result(self,
+                                folder_id: str,
+                                query_id: str,
+                                query_info: Optional[dict[str, Any]],
+                                lazy: bool = False) -> Any:
+        iam_token = await self._get_iam_token()
+        if query_info is None:
+            query_info = await self.get_queryinfo(folder_id,
+                                                  query_id,
+                                                  iam_token)
+        YandexQuery._check_query_succeeded(query_info)
 
-        return YandexQueryResults(results)
+        if lazy:
+            return self._lazy_query_results(folder_id,
+                                            query_id,
+                                            query_info["result_sets"])
 
-    async def get_query_result(self, folder_id: str, query_id: str) -> Any:
-        """Retrieves all query results"""
+        result_set_count = len(query_info["result_sets"])
 
-        iam_token = await self._get_iam_token()
-        query_info = await self.get_queryinfo(folder_id, query_id, iam_token)
+        return await self._query_results(folder_id,
+                                         query_id,
+                                         result_set_count,
+                                         iam_token,
+                                         query_info["result_sets"])
 
+    @staticmethod
+    def _check_query_succeeded(query_info: dict[str, Any]) -> None:
         if query_info["status"] in ["FAILED",
                                     "ABORTED_BY_USER",
                                     "ABORTED_BY_SYSTEM"]:
@@ -301,20 +965,134 @@ class YandexQuery:
 
             raise YandexQueryException(issues)
 
-        result_set_count = len(query_info["result_sets"])
+    async def get_query_result_parquet(
+            self,
+            folder_id: str,
+            query_id: str,
+            directory: str,
+            query_info: Optional[dict[str, Any]] = None) -> ParquetResults:
+        """Writes query results to Parquet files while they are being
+        downloaded: <directory>/<query_id>/result_set_<index>.parquet,
+        one row group per page. Only a few pages are kept in memory,
+        so results may be larger than available RAM.
+        Column types are mapped from YQL types. Requires pyarrow package
+        :query_info information of the finished query if already known
+        :return: lazy handle to written files
+        """
 
-        return await self._query_results(folder_id,
-                                         query_id,
-                                         result_set_count,
-                                         iam_token)
+        if query_info is None:
+            query_info = await self.get_queryinfo(folder_id, query_id)
+        YandexQuery._check_query_succeeded(query_info)
+
+        query_dir = os.path.join(directory, query_id)
+        os.makedirs(query_dir, exist_ok=True)
+
+        paths = []
+        row_counts = []
+        with self.tracer.span("yq.fetch_results",
+                              {"yq.query_id": query_id,
+                               "yq.result_sets":
+                                   len(query_info["result_sets"]),
+                               "yq.parquet": True}) as span:
+            for result_index in range(0, len(query_info["result_sets"])):
+                path = os.path.join(query_dir,
+                                    f"result_set_{result_index}.parquet")
+                writer = None
+                try:
+                    pages = self.iter_result_pages(folder_id,
+                                                   query_id,
+                                                   result_index,
+                                                   raw=True)
+                    async with contextlib.aclosing(pages):
+                        async for columns, rows in pages:
+                            # conversion and writing run in thread,
+                            # while next pages are being downloaded
+                            if writer is None:
+                                writer = await asyncio.to_thread(
+                                    ParquetPageWriter, path, columns)
+
+                            await asyncio.to_thread(writer.write, rows)
+                finally:
+                    if writer is not None:
+                        await asyncio.to_thread(writer.close)
+
+                paths.append(path)
+                row_counts.append(writer.rows)
+
+            span.set_attribute("yq.rows", sum(row_counts))
+
+        return ParquetResults(paths, row_counts)
+
+    async def run_many(self,
+                       folder_id: str,
+                       queries: list[str | dict[str, str]],
+                       max_concurrency: int = 4,
+                       on_status_update: Optional[Callable[[int, str], None]] = None,  # noqa: E501
+                       on_progress_update: Optional[Callable[[int, int, datetime], None]] = None,  # noqa: E501
+                       polling_policy: Optional[PollingPolicy] = None)\
+            -> list[YandexQueryResults | BaseException]:
+        """Executes several queries concurrently:
+        submits, waits and fetches results of up to max_concurrency
+        queries at once
+        :queries query texts or dicts with text, name and description keys
+        :on_status_update called with query index and its new status
+        :on_progress_update called with query index, progress and
+        query start time
+        :return: results or exception for each query in input order
+        """
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(index: int, query: str | dict[str, str]) \
+                -> YandexQueryResults:
+            if isinstance(query, str):
+                query = {"text": query}
+
+            def update_status(status: str) -> None:
+                if on_status_update is not None:
+                    on_status_update(index, status)
+
+            def update_progress(progress: int, started: datetime) -> None:
+                if on_progress_update is not None:
+                    on_progress_update(index, progress, started)
+
+            async with semaphore:
+                handle = await self.start_execute_query(
+                    folder_id,
+                    query["text"],
+                    query.get("name", None),
+                    query.get("description", None))
+
+                try:
+                    await handle.wait(update_status,
+                                      update_progress,
+                                      polling_policy)
+                except BaseException:
+                    # do not leave abandoned queries running,
+                    # e.g. cancelled or exceeded polling deadline
+                    try:
+                        await asyncio.shield(handle.stop())
+                    except Exception:
+                        pass
+                    raise
+
+                update_status("FETCHING_RESULTS")
+                return await handle.results()
+
+        return await asyncio.gather(*[run(index, query)
+                                      for index, query in enumerate(queries)],
+                                    return_exceptions=True)
 
     # https://cloud.yandex.com/en/docs/query/api/methods/stop-query
     async def stop_query(self, folder_id: str, query_id: str) -> None:
-        """Stops the query"""
+        """Stops the query.
+        Query shared by coalesced callers is stopped only when the last
+        of them stops it, others are just detached from it"""
 
-        iam_token = await self._get_iam_token()
+        if not YandexQuery.coalescer.detach(query_id):
+            return
 
-        async with await self.create_async_session(iam_token) as session:
-            url = urljoin(self.base_api_url,
-                          f"fq/v1/queries/{query_id}/stop?project={folder_id}")
-            await session.post(url, raise_for_status=True)
+        YandexQuery.coalescer.finish(query_id)
+        url = urljoin(self.base_api_url,
+                      f"fq/v1/queries/{query_id}/stop?project={folder_id}")
+        await self._call_api("stop", "POST", url)
@@ -0,0 +1,65 @@
+from typing import Any, Optional
+from .arrow_conversion import import_pyarrow, arrow_schema, \
+    rows_to_record_batch
+
+
+class ParquetPageWriter:
+    """Writes pages of one result set to Parquet file,
+    each page is a separate row group"""
+
+    def __init__(self, path: str, columns: list[dict[str, str]]):
+        import_pyarrow()
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.columns = columns
+        self.schema = arrow_schema(columns)
+        self.rows = 0
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows: list[list[Any]]) -> None:
+        batch = rows_to_record_batch(self.columns, rows, self.schema)
+        self._writer.write_batch(batch)
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class ParquetResults:
+    """Lazy handle to query results written to Parquet files,
+    one file per result set. Nothing is read until requested"""
+
+    def __init__(self, paths: list[str], row_counts: list[int]):
+        self.paths = paths
+        self.row_counts = row_counts
+
+    def __repr__(self) -> str:
+        sets = ", ".join(f"{path} ({rows} rows)"
+                         for path, rows in zip(self.paths, self.row_counts))
+        return f"ParquetResults([{sets}])"
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def dataset(self, index: int = 0) -> Any:
+        """Returns pyarrow dataset over result set file
+        for lazy filtering and projection"""
+
+        import_pyarrow()
+        import pyarrow.dataset as ds
+        return ds.dataset(self.paths[index], format="parquet")
+
+    def to_arrow(self, index: int = 0) -> Any:
+        import_pyarrow()
+        import pyarrow.parquet as pq
+        return pq.read_table(self.paths[index])
+
+    def to_dataframes(self, index: Optional[int] = 0):
+        if len(self.paths) == 0:
+            return None
+        elif index is not None:
+            return self.to_arrow(index).to_pandas()
+        else:
+            return [self.to_arrow(rs_index).to_pandas()
+                    for rs_index in range(0, len(self.paths))]
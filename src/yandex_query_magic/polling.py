@@ -0,0 +1,73 @@
+import random
+from typing import Iterator, Optional
+
+
+class PollingPolicy:
+    """Delays between query status checks while waiting for results.
+
+    First polls are done quickly to catch short queries, then delay
+    grows exponentially up to max_delay. Jitter spreads polls of
+    simultaneously started queries. Deadline limits total waiting time
+    """
+
+    def __init__(self,
+                 initial_delay: float = 0.2,
+                 fast_polls: int = 3,
+                 multiplier: float = 1.5,
+                 max_delay: float = 5.0,
+                 jitter: float = 0.1,
+                 deadline: Optional[float] = None):
+        """
+        :initial_delay seconds between first polls
+        :fast_polls number of polls done with initial delay
+        :multiplier growth factor of delay after fast polls
+        :max_delay maximum seconds between polls
+        :jitter relative random deviation of each delay, 0 to disable
+        :deadline maximum seconds to wait for query completion,
+        None to wait forever
+        """
+
+        if initial_delay <= 0 or max_delay < initial_delay:
+            raise ValueError("0 < initial_delay <= max_delay is required")
+
+        if multiplier < 1:
+            raise ValueError("multiplier must be at least 1")
+
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be in [0, 1) range")
+
+        self.initial_delay = initial_delay
+        self.fast_polls = fast_polls
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    @staticmethod
+    def interactive() -> "PollingPolicy":
+        """Policy for notebook cells: short queries are noticed fast"""
+
+        return PollingPolicy(initial_delay=0.2, fast_polls=5,
+                             multiplier=1.5, max_delay=3.0, jitter=0.1)
+
+    @staticmethod
+    def batch() -> "PollingPolicy":
+        """Policy for long running batches: rare polls"""
+
+        return PollingPolicy(initial_delay=1.0, fast_polls=1,
+                             multiplier=2.0, max_delay=30.0, jitter=0.2)
+
+    def delays(self) -> Iterator[float]:
+        """Infinite sequence of delays between polls"""
+
+        delay = self.initial_delay
+        polls = 0
+        while True:
+            if self.jitter > 0:
+                yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            else:
+                yield delay
+
+            polls += 1
+            if polls >= self.fast_polls:
+                delay = min(delay * self.multiplier, self.max_delay)
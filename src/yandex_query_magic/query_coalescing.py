@@ -0,0 +1,156 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from .async_utils import retrieve_exception
+
+
+# string literals and comments are kept as is (line comment with its
+# ending newline), whitespace outside them is collapsed
+_QUERY_TOKEN = re.compile(r"""@@.*?@@"""
+                          r"""|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`"""
+                          r"""|--[^\n]*\n?|/\*.*?\*/|\s+""",
+                          re.DOTALL)
+
+
+class QueryCoalescer:
+    """Process wide registry of queries being executed.
+
+    Identical query (same folder and normalised text) submitted while
+    the first one is still running attaches to its execution instead of
+    starting a new one. Results of a query are downloaded once for all
+    concurrent callers. Submissions and downloads are shared only
+    within one event loop
+    """
+
+    def __init__(self):
+        # key -> task submitting query, pending or succeeded
+        self._running: Dict[Hashable, asyncio.Task] = {}
+
+        # query id -> key of running query
+        self._keys: Dict[str, Hashable] = {}
+
+        # query id -> task downloading results
+        self._results: Dict[str, asyncio.Task] = {}
+
+        # query id -> number of callers attached to running query
+        self._attached: Dict[str, int] = {}
+
+        self.coalesced_submits = 0
+        self.coalesced_results = 0
+
+    @staticmethod
+    def normalize(query_text: str) -> str:
+        def replace(match: re.Match) -> str:
+            token = match.group()
+            return " " if token.isspace() else token
+
+        return _QUERY_TOKEN.sub(replace, query_text).strip().rstrip(";")\
+            .strip()
+
+    @staticmethod
+    def make_key(folder_id: str, query_text: str) -> Tuple[str, str]:
+        return folder_id, QueryCoalescer.normalize(query_text)
+
+    async def submit(self,
+                     folder_id: str,
+                     query_text: str,
+                     submit: Callable[[], Awaitable[str]]) -> str:
+        """Returns id of running identical query or submits a new one
+        :submit coroutine submitting the query and returning its id
+        """
+
+        loop = asyncio.get_running_loop()
+        key = QueryCoalescer.make_key(folder_id, query_text)
+
+        task = self._running.get(key, None)
+        if task is not None and task.get_loop() is loop:
+            self.coalesced_submits += 1
+        else:
+            task = loop.create_task(self._submit(key, submit))
+            task.add_done_callback(retrieve_exception)
+            self._running[key] = task
+
+        # the submission is shared, so it is not cancelled with one caller
+        query_id = await asyncio.shield(task)
+        self._attached[query_id] = self._attached.get(query_id, 0) + 1
+        return query_id
+
+    async def _submit(self,
+                      key: Hashable,
+                      submit: Callable[[], Awaitable[str]]) -> str:
+        try:
+            query_id = await submit()
+        except BaseException:
+            if self._running.get(key, None) is asyncio.current_task():
+                del self._running[key]
+            raise
+
+        self._keys[query_id] = key
+        return query_id
+
+    def finish(self, query_id: str) -> None:
+        """Marks query as completed, so identical queries
+        submitted later start new execution"""
+
+        self._attached.pop(query_id, None)
+        self.forget(query_id)
+
+    def forget(self, query_id: str) -> None:
+        """Identical queries submitted later start new execution,
+        callers already attached to the query stay attached"""
+
+        key = self._keys.pop(query_id, None)
+        if key is None:
+            return
+
+        task = self._running.get(key, None)
+        if task is not None and task.done() and not task.cancelled() and\
+                task.exception() is None and task.result() == query_id:
+            del self._running[key]
+
+    def detach(self, query_id: str) -> bool:
+        """Detaches one caller from the query
+        :return: True if no other callers are attached,
+        so the query can be stopped
+        """
+
+        attached = self._attached.get(query_id, 0) - 1
+        if attached > 0:
+            self._attached[query_id] = attached
+            return False
+
+        self._attached.pop(query_id, None)
+        return True
+
+    async def results(self,
+                      query_id: str,
+                      fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns results being downloaded for the query
+        or downloads them with fetch"""
+
+        loop = asyncio.get_running_loop()
+
+        task = self._results.get(query_id, None)
+        if task is not None and task.get_loop() is loop:
+            self.coalesced_results += 1
+        else:
+            task = loop.create_task(self._fetch_results(query_id, fetch))
+            task.add_done_callback(retrieve_exception)
+            self._results[query_id] = task
+
+        return await asyncio.shield(task)
+
+    async def _fetch_results(self,
+                             query_id: str,
+                             fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fetch()
+        finally:
+            if self._results.get(query_id, None) is asyncio.current_task():
+                del self._results[query_id]
+
+    def clear(self) -> None:
+        self._running.clear()
+        self._keys.clear()
+        self._results.clear()
+        self._attached.clear()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, TYPE_CHECKING
+from .polling import PollingPolicy
+
+if TYPE_CHECKING:
+    from .main import YandexQuery
+
+
+class QueryHandle(str):
+    """Submitted query: its id together with folder, last known status
+    and query information.
+
+    Query information does not change after the query is finished,
+    so it is requested once and reused by results. Being str, handle can
+    be used wherever query id is expected
+    """
+
+    FINAL_STATUSES = frozenset(["COMPLETED", "FAILED",
+                                "ABORTED_BY_USER", "ABORTED_BY_SYSTEM"])
+
+    def __new__(cls, query_id: str, yq: YandexQuery, folder_id: str):
+        handle = super().__new__(cls, query_id)
+        handle.yq = yq
+        handle.folder_id = folder_id
+        handle.status: Optional[str] = None
+        handle.submitted_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        handle._info: Optional[dict[str, Any]] = None
+        return handle
+
+    @property
+    def query_id(self) -> str:
+        return str(self)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in QueryHandle.FINAL_STATUSES
+
+    @property
+    def result_sets(self) -> Optional[list[dict[str, Any]]]:
+        """Result set descriptions if query information is known"""
+
+        return None if self._info is None\
+            else self._info.get("result_sets", None)
+
+    async def wait(self,
+                   on_status_update: Optional[Callable[[str], None]] = None,
+                   on_progress_update: Optional[Callable[[int, datetime], None]] = None,  # noqa: E501
+                   polling_policy: Optional[PollingPolicy] = None) -> str:
+        """Waits the query to finish.
+        Progress is reported relative to submission time, so query
+        information is not requested before polling
+        :return: final status
+        """
+
+        def update_status(status: str) -> None:
+            self._set_status(status)
+            if on_status_update is not None:
+                on_status_update(status)
+
+        def update_progress(progress: int, started: datetime) -> None:
+            if on_progress_update is not None:
+                on_progress_update(progress, started)
+
+        if not self.finished:
+            await self.yq.wait_results(self.folder_id,
+                                       self.query_id,
+                                       update_status,
+                                       update_progress,
+                                       polling_policy,
+                                       started_at=self.submitted_at)
+
+        return self.status
+
+    async def info(self, refresh: bool = False) -> dict[str, Any]:
+        """Returns query information,
+        requested once after the query is finished"""
+
+        if self._info is None or refresh or not self.finished:
+            info = await self.yq.get_queryinfo(self.folder_id, self.query_id)
+            self._info = info
+            self._set_status(info["status"])
+
+        return self._info
+
+    async def results(self, lazy: bool = False) -> Any:
+        """Retrieves query results,
+        see YandexQuery.get_query_result"""
+
+        return await self.yq.get_query_result(self.folder_id,
+                                              self.query_id,
+                                              await self.info(),
+                                              lazy)
+
+    async def results_to_parquet(self, directory: str) -> Any:
+        """Writes query results to Parquet files,
+        see YandexQuery.get_query_result_parquet"""
+
+        return await self.yq.get_query_result_parquet(self.folder_id,
+                                                      self.query_id,
+                                                      directory,
+                                                      await self.info())
+
+    async def stop(self) -> None:
+        await self.yq.stop_query(self.folder_id, self.query_id)
+        self.status = None
+        self._info = None
+
+    def _set_status(self, status: str) -> None:
+        if status != self.status:
+            self.status = status
+            if not self.finished:
+                self._info = None
@@ -1,18 +1,32 @@
 from __future__ import annotations
 from typing import Any, Optional
 import base64
+import functools
 import pprint
-import dateutil.parser
 from datetime import datetime
 from decimal import Decimal
+from .yql_types import YqlType, parse_type, INT_TYPES, TEXT_TYPES, \
+    DATETIME_TYPES
+from .datetime_decoding import parse_datetime, parse_datetimes
+from .column_conversion import DTYPE_BACKENDS, column_converter, \
+    nullable_column_converter, transpose
 
 
 class YQResults:
     """Holds and formats query execution results"""
 
-    def __init__(self, results: dict[str, Any]):
+    def __init__(self,
+                 results: dict[str, Any],
+                 converted_rows: Optional[list[Any]] = None):
+        """
+        :converted_rows rows converted beforehand, e.g. with convert_rows
+        """
+
         self._raw_results = results
         self._results = None
+        if converted_rows is not None:
+            self._results = {"rows": converted_rows,
+                             "columns": results["columns"]}
 
     @staticmethod
     def _convert_from_float(value: float | str) -> Optional[float]:
@@ -52,71 +66,18 @@ class YQResults:
     @staticmethod
     def _convert_from_datetime(value: str) -> datetime:
         # suitable for yql data and datetime parsing
-        return dateutil.parser.isoparse(value)
+        return parse_datetime(value)
 
     @staticmethod
     def _convert_from_pgdatetime(value: str | None) -> Optional[datetime]:
         if value is None:
             return None
-        return dateutil.parser.isoparse(value)
+        return parse_datetime(value)
 
     @staticmethod
     def _convert_from_enum(value: list) -> str:
         return str(value[0])
 
-    @staticmethod
-    def _extract_from_optional(type: str) -> str:
-        # Uint16? -> Uint16
-        if type.endswith("?"):
-            return type[0:-1]
-
-        # Optional<Uint16> -> Uint16
-        return type[len("Optional<"):-1]
-
-    @staticmethod
-    def _extract_from_set(type: str) -> str:
-        # Set<Uint16> -> Uint16
-        return type[len("Set<"):-1]
-
-    @staticmethod
-    def _extract_from_list(type: str) -> str:
-        # List<Uint16> -> Uint16
-        return type[len("List<"):-1]
-
-    @staticmethod
-    def _split_type_list(type_list: str) -> list[str]:
-        # naive implementation
-        # todo fix it
-        return type_list.split(",")
-
-    @staticmethod
-    def _extract_from_tuple(type: str) -> list[str]:
-        # Tuple<Uint16, String, Double> -> [Uint16, String, Double]
-        return YQResults._split_type_list(type[len("Tuple<"):-1])
-
-    @staticmethod
-    def _extract_from_dict(type: str) -> (str, str):
-        # Dict<Uint16, String> -> (Uint16, String)
-        [key_type, value_type] = YQResults._split_type_list(type[len("Dict<"):-1])
-        return key_type, value_type
-
-    @staticmethod
-    def _extract_from_variant_over_struct(type: str) -> (str, str):
-        # Variant<'One':Int32,'Two':String> -> {One: Int32, Two: String}
-        types_with_names = YQResults._split_type_list(type[len("Variant<"):-1])
-        result = {}
-        for t in types_with_names:
-            [n, t] = t.split(":")
-            # strip '
-            n = n[1:-1]
-            result[n] = t
-        return result
-
-    @staticmethod
-    def _extract_from_variant_over_tuple(type: str) -> (str, str):
-        # Variant<Int32,String> -> [Int32, String]
-        return YQResults._split_type_list(type[len("Variant<"):-1])
-
     @staticmethod
     def _convert_from_optional(value: list[Any]) -> Optional[Any]:
         # Optional types are encoded as [[]] objects
@@ -135,38 +96,52 @@ class YQResults:
     def id(v):
         return v
 
+    _IDENTITY_TYPES = INT_TYPES | TEXT_TYPES |\
+        frozenset(["Bool", "Void", "Null", "EmptyList"])
+
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def _get_converter(column_type: str) -> Any:
-        """Returns converter based on column type"""
+        """Returns converter based on column type.
+        Converters are compiled once per distinct type"""
+
+        try:
+            return YQResults._compile_converter(parse_type(column_type))
+        except (ValueError, IndexError):
+            # malformed or unsupported type
+            return YQResults.id
+
+    @staticmethod
+    def _compile_converter(yql_type: YqlType) -> Any:
+        """Returns converter of parsed type"""
+
+        name = yql_type.name
+        args = yql_type.args
 
         # primitives
-        if column_type in ["Int8", "Int16", "Int32", "Int64",
-                           "Uint8", "Uint16", "Uint32", "Uint64",
-                           "Bool", "Utf8", "Uuid",
-                           "Void", "Null",
-                           "EmptyList", "Struct<>", "Tuple<>"]:
+        if name in YQResults._IDENTITY_TYPES:
             return YQResults.id
 
-        if column_type == "String":
+        if name == "String":
             return YQResults._convert_from_base64
 
-        if column_type in ["Float", "Double"]:
+        if name in ["Float", "Double"]:
             return YQResults._convert_from_float
 
-        if column_type.startswith("Decimal("):
+        if name == "Decimal":
             return YQResults._convert_from_decimal
 
-        if column_type.startswith("Enum<"):
+        if name == "Enum":
             return YQResults._convert_from_enum
 
-        if column_type in ["Date", "Datetime", "Timestamp"]:
+        if name in DATETIME_TYPES:
             return YQResults._convert_from_datetime
 
         # containers
-        if column_type.startswith("Optional<") or column_type.endswith("?"):
-            # If type is Optional than get base type
-            inner_converter = YQResults._get_converter(
-                YQResults._extract_from_optional(column_type))
+        inner_converters = [YQResults._compile_converter(t) for t in args]
+
+        if name == "Optional":
+            inner_converter = inner_converters[0]
 
             # Remove "Optional" encoding
             # and convert resulting value as others
@@ -178,26 +153,28 @@ class YQResults:
 
             return convert
 
-        if column_type.startswith("Set<"):
-            inner_converter = YQResults._get_converter(YQResults._extract_from_set(column_type))
+        if name == "Tagged":
+            return inner_converters[0]
+
+        if name == "Set":
+            inner_converter = inner_converters[0]
 
             def convert(x):
                 return {inner_converter(v) for v in x}
 
             return convert
 
-        if column_type.startswith("List<"):
-            inner_converter = YQResults._get_converter(YQResults._extract_from_list(column_type))
+        if name == "List":
+            inner_converter = inner_converters[0]
+            if inner_converter is YQResults.id:
+                return YQResults.id
 
             def convert(x):
                 return [inner_converter(v) for v in x]
 
             return convert
 
-        if column_type.startswith("Tuple<"):
-            inner_types = YQResults._extract_from_tuple(column_type)
-            inner_converters = [YQResults._get_converter(t) for t in inner_types]
-
+        if name == "Tuple":
             def convert(x):
                 assert len(x) == len(
                     inner_converters), f"Wrong lenght for tuple value: {len(x)} != {len(inner_converters)}"
@@ -205,36 +182,39 @@ class YQResults:
 
             return convert
 
-        # variant over struct
-        if column_type.startswith("Variant<'"):
-            inner_types = YQResults._extract_from_variant_over_struct(column_type)
-            inner_converters = {k: YQResults._get_converter(t) for k, t in inner_types.items()}
+        if name == "Struct":
+            # struct is encoded as list of member values
+            members = list(zip(yql_type.names, inner_converters))
 
             def convert(x):
-                return inner_converters[x[0]](x[1])
+                return {n: c(v) for ((n, c), v) in zip(members, x)}
 
             return convert
 
-        # variant over tuple
-        if column_type.startswith("Variant<"):
-            inner_types = YQResults._extract_from_variant_over_tuple(column_type)
-            inner_converters = [YQResults._get_converter(t) for t in inner_types]
+        if name == "Variant" and len(yql_type.names) > 0:
+            # variant over struct is encoded as [member name, value]
+            named_converters = dict(zip(yql_type.names, inner_converters))
+
+            def convert(x):
+                return named_converters[x[0]](x[1])
+
+            return convert
 
+        if name == "Variant":
+            # variant over tuple is encoded as [member index, value]
             def convert(x):
-                return inner_converters[x[0]](x[1])
+                return inner_converters[int(x[0])](x[1])
 
             return convert
 
-        if column_type == "EmptyDict":
+        if name == "EmptyDict":
             def convert(x):
                 return {}
 
             return convert
 
-        if column_type.startswith("Dict<"):
-            key_type, value_type = YQResults._extract_from_dict(column_type)
-            key_converter = YQResults._get_converter(key_type)
-            value_converter = YQResults._get_converter(value_type)
+        if name == "Dict":
+            key_converter, value_converter = inner_converters
 
             def convert(x):
                 return {key_converter(v[0]): value_converter(v[1]) for v in x}
@@ -242,40 +222,134 @@ class YQResults:
             return convert
 
         # pg types
-        if column_type.startswith("pgfloat"):
+        if name.startswith("pgfloat"):
             return YQResults._convert_from_pgfloat
 
-        if column_type in ["pgint2", "pgint4", "pgint8"]:
+        if name in ["pgint2", "pgint4", "pgint8"]:
             return YQResults._convert_from_pgint
 
-        if column_type == "pgnumeric":
+        if name == "pgnumeric":
             return YQResults._convert_from_pgnumeric
 
-        if column_type in ["pgdate", "pgtimestamp"]:
+        if name in ["pgdate", "pgtimestamp"]:
             return YQResults._convert_from_pgdatetime
 
-        if column_type.startswith("pg"):
-            return YQResults.id
-
         # unsupported type
         return YQResults.id
 
-    def _convert(self):
-        converters = []
-        converted_results = []
-        for column in self._raw_results["columns"]:
-            converters.append(YQResults._get_converter(column["type"]))
+    @staticmethod
+    def _value_expression(column_type: str,
+                          value: str,
+                          converter: str,
+                          namespace: dict[str, Any]) -> str:
+        """Returns python expression converting value of the type,
+        converters used in it are added to namespace"""
 
-        for row in self._raw_results["rows"]:
-            new_row = []
-            for index, value in enumerate(row):
-                converter = converters[index]
-                new_row.append(
-                    value if converter is None else converter(value))
+        try:
+            yql_type = parse_type(column_type)
+        except ValueError:
+            return value
+
+        def expression(yql_type: YqlType, value: str) -> str:
+            if yql_type.name == "Optional":
+                # Optional value is encoded as [] for null or [value]
+                inner = expression(yql_type.args[0], f"{value}[0]")
+                if inner == f"{value}[0]":
+                    return f"({value}[0] if {value} else None)"
+                return f"(None if not {value} or {value}[0] is None " \
+                       f"else {inner})"
+
+            if yql_type.name == "Tagged":
+                return expression(yql_type.args[0], value)
+
+            try:
+                compiled = YQResults._compile_converter(yql_type)
+            except (ValueError, IndexError):
+                return value
+
+            if compiled is YQResults.id:
+                return value
+            elif compiled is YQResults._convert_from_float:
+                return f"float({value})"
+            elif compiled is YQResults._convert_from_decimal:
+                return f"Decimal({value})"
+            elif compiled is YQResults._convert_from_enum:
+                return f"str({value}[0])"
+
+            namespace[converter] = compiled
+            return f"{converter}({value})"
+
+        return expression(yql_type, value)
 
-            converted_results.append(new_row)
+    @staticmethod
+    def _datetime_batch(column_type: str, value: str) -> Optional[str]:
+        """Returns expression of date string to parse for date columns,
+        None for other columns"""
+
+        try:
+            yql_type = parse_type(column_type)
+        except ValueError:
+            return None
+
+        if yql_type.name in DATETIME_TYPES:
+            return value
+
+        if yql_type.name in ["pgdate", "pgtimestamp"]:
+            return value
+
+        if yql_type.name == "Optional" and\
+                yql_type.args[0].name in DATETIME_TYPES:
+            # Optional value is encoded as [] for null or [value]
+            return f"({value}[0] if {value} else None)"
+
+        return None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _row_decoder(column_types: tuple[str, ...]) -> Any:
+        """Compiles function converting rows of the schema:
+        identity columns are copied as is, simple converters and
+        Optional unwrapping are inlined.
+        Functions are cached by column types"""
+
+        namespace: dict[str, Any] = {"Decimal": Decimal,
+                                     "parse_datetimes": parse_datetimes}
+        values = [f"v{index}" for index in range(0, len(column_types))]
+        expressions = []
+        batches = []
+        for index, column_type in enumerate(column_types):
+            batch = YQResults._datetime_batch(column_type, f"row[{index}]")
+            if batch is not None:
+                # dates are parsed for whole column at once
+                batches.append(f"    d{index} = iter(parse_datetimes("
+                               f"[{batch} for row in rows]))\n")
+                expressions.append(f"next(d{index})")
+            else:
+                expressions.append(
+                    YQResults._value_expression(column_type,
+                                                values[index],
+                                                f"c{index}",
+                                                namespace))
+
+        if len(column_types) == 0:
+            source = "def decode(rows):\n" \
+                     "    return [[] for _ in rows]\n"
+        else:
+            source = "def decode(rows):\n" + "".join(batches) + \
+                     f"    return [[{', '.join(expressions)}]\n" \
+                     f"            for [{', '.join(values)}] in rows]\n"
+
+        exec(compile(source, f"<yq row decoder {column_types}>", "exec"),
+             namespace)
+        return namespace["decode"]
+
+    def _convert(self):
+        columns = self._raw_results["columns"]
+        decode = YQResults._row_decoder(tuple(column["type"]
+                                              for column in columns))
 
-        self._results = {"rows": converted_results, "columns": self._raw_results["columns"]}
+        self._results = {"rows": decode(self._raw_results["rows"]),
+                         "columns": columns}
 
     def _repr_pretty_(self, p, cycle):
         p.text(pprint.pformat(self._results))
@@ -292,10 +366,69 @@ class YQResults:
         return self._raw_results
 
     def to_table(self):
-        return self._results["rows"]
+        return self.results["rows"]
+
+    def to_dataframe(self,
+                     dtype_backend: Optional[str] = None,
+                     decimal_as_float: bool = False):
+        """Converts results to DataFrame
+        :dtype_backend None to infer numpy dtypes from values,
+        "numpy_nullable" for pandas nullable dtypes (Int64, boolean,
+        string, ...) or "pyarrow" for pyarrow backed dtypes.
+        Column dtypes are derived from YQL types, nulls are kept as NA
+        :decimal_as_float convert Decimal columns to floats
+        """
 
-    def to_dataframe(self):
-        result_set = self._results
-        columns = [column["name"] for column in result_set["columns"]]
         import pandas
-        return pandas.DataFrame(result_set["rows"], columns=columns)
+        if dtype_backend is not None and dtype_backend not in DTYPE_BACKENDS:
+            raise ValueError(f"Unknown dtype backend {dtype_backend}, "
+                             f"expected one of {DTYPE_BACKENDS}")
+
+        if dtype_backend == "pyarrow":
+            from .arrow_conversion import decimals_to_float
+            table = self.to_arrow()
+            if decimal_as_float:
+                table = decimals_to_float(table)
+            return table.to_pandas(types_mapper=pandas.ArrowDtype)
+
+        columns = [column["name"] for column in self._raw_results["columns"]]
+
+        if self._results is not None and dtype_backend is None\
+                and not decimal_as_float:
+            # already converted to python values
+            return pandas.DataFrame(self._results["rows"], columns=columns)
+
+        # whole columns are converted at once from raw values
+        data = transpose(self._raw_results["rows"], len(columns))
+        for index, column in enumerate(self._raw_results["columns"]):
+            value_converter = YQResults._get_converter(column["type"])
+            if dtype_backend is None:
+                converter = column_converter(column["type"], value_converter,
+                                             decimal_as_float)
+            else:
+                converter = nullable_column_converter(column["type"],
+                                                      value_converter,
+                                                      decimal_as_float)
+            data[index] = converter(data[index])
+
+        if len(self._raw_results["rows"]) == 0 and dtype_backend is None:
+            return pandas.DataFrame([], columns=columns)
+
+        dataframe = pandas.DataFrame(dict(enumerate(data)))
+        dataframe.columns = columns
+        return dataframe
+
+    def to_arrow(self):
+        """Returns pyarrow Table built from raw values, column types
+        are mapped from YQL types. Requires pyarrow package"""
+
+        from .arrow_conversion import rows_to_table
+        return rows_to_table(self._raw_results["columns"],
+                             self._raw_results["rows"])
+
+
+def convert_rows(page: dict[str, Any]) -> list[Any]:
+    """Converts rows of raw results page.
+    Module level function, so it can be run in process pool"""
+
+    return YQResults(page).results["rows"]
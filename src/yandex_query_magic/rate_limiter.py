@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket: rate tokens per second, up to burst tokens in store.
+    Tokens are reserved in advance, so waiting callers are served
+    in order of arrival"""
+
+    def __init__(self, rate: float, burst: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes one token
+        :return: seconds to wait until the token is available
+        """
+
+        now = time.monotonic()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiterStats:
+    """Counters of calls passed through one limit"""
+
+    def __init__(self):
+        self.calls = 0
+        self.delayed = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __repr__(self) -> str:
+        return (f"RateLimiterStats(calls={self.calls}, "
+                f"delayed={self.delayed}, "
+                f"wait_time={self.wait_time:.3f}, "
+                f"max_wait={self.max_wait:.3f})")
+
+
+class RateLimiter:
+    """Client side limits of YQ API call rates.
+
+    Calls are limited in groups: submit (query submission and stop),
+    status (status and info polling) and results (result pages).
+    Authentication calls are not limited. Limits are disabled
+    until rate is set for the group
+    """
+
+    OPERATION_GROUPS = {
+        "submit": "submit",
+        "stop": "submit",
+        "status": "status",
+        "info": "status",
+        "results": "results",
+    }
+
+    GROUPS = ("submit", "status", "results")
+
+    def __init__(self,
+                 rates: Optional[dict[str, float]] = None,
+                 bursts: Optional[dict[str, float]] = None):
+        """
+        :rates calls per second by group, groups without rate are
+        not limited
+        :bursts number of calls by group allowed at once after idle time,
+        equals to rate by default
+        """
+
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self.stats = {group: RateLimiterStats()
+                      for group in RateLimiter.GROUPS}
+
+        bursts = {} if bursts is None else bursts
+        for group, rate in ({} if rates is None else rates).items():
+            self.set_rate(group, rate, bursts.get(group, None))
+
+    def set_rate(self,
+                 group: str,
+                 rate: Optional[float],
+                 burst: Optional[float] = None) -> None:
+        """Sets calls per second of the group, None removes the limit"""
+
+        if group not in RateLimiter.GROUPS:
+            raise ValueError(f"Unknown group {group}, "
+                             f"expected one of {RateLimiter.GROUPS}")
+
+        with self._lock:
+            if rate is None:
+                self._buckets.pop(group, None)
+            else:
+                burst = max(rate, 1.0) if burst is None else burst
+                self._buckets[group] = TokenBucket(rate, burst)
+
+    async def acquire(self, operation: str) -> float:
+        """Waits until the call of operation is allowed
+        :return: seconds waited
+        """
+
+        group = RateLimiter.OPERATION_GROUPS.get(operation, None)
+        if group is None:
+            return 0.0
+
+        with self._lock:
+            bucket = self._buckets.get(group, None)
+            delay = 0.0 if bucket is None else bucket.reserve()
+
+            stats = self.stats[group]
+            stats.calls += 1
+            if delay > 0:
+                stats.delayed += 1
+                stats.wait_time += delay
+                stats.max_wait = max(stats.max_wait, delay)
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return delay
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {group: RateLimiterStats()
+                          for group in RateLimiter.GROUPS}
@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Any, Optional
+
+
+class ResultCache:
+    """Local disk cache of raw query results.
+
+    Entries are keyed by folder id and final query text, expire after
+    their ttl and are evicted least recently used first when total size
+    exceeds max_size bytes. Each entry is a gzip file with a json header
+    line followed by a json line with raw results
+    """
+
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"),
+                                     ".cache", "yandex_query_magic")
+
+    ENTRY_SUFFIX = ".json.gz"
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 ttl: float = 3600,
+                 max_size: int = 1024 * 1024 * 1024):
+        """
+        :directory cache directory, ~/.cache/yandex_query_magic by default
+        :ttl seconds to keep results
+        :max_size maximum total size of cache files in bytes
+        """
+
+        self.directory = ResultCache.DEFAULT_DIRECTORY\
+            if directory is None else directory
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(folder_id: str, query_text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(folder_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(query_text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ResultCache.ENTRY_SUFFIX)
+
+    def get(self, folder_id: str, query_text: str) -> Optional[Any]:
+        """Returns cached raw results or None if there are no
+        fresh results for the query"""
+
+        path = self._entry_path(ResultCache.make_key(folder_id, query_text))
+        results = None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                expired = header["expires_at"] < time.time()
+                if not expired:
+                    results = json.loads(f.readline())
+
+            if expired:
+                os.remove(path)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if results is None:
+            self.misses += 1
+            return None
+
+        # file modification time is used as last access time for LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return results
+
+    def put(self,
+            folder_id: str,
+            query_text: str,
+            raw_results: Any,
+            ttl: Optional[float] = None) -> None:
+        """Stores raw results of the query and evicts old entries"""
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        ttl = self.ttl if ttl is None else ttl
+        path = self._entry_path(ResultCache.make_key(folder_id, query_text))
+        header = {"folder_id": folder_id, "expires_at": time.time() + ttl}
+
+        # written to temporary file first, so readers
+        # never see partially written entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header))
+            f.write("\n")
+            json.dump(raw_results, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def _entries(self) -> list[os.DirEntry]:
+        try:
+            with os.scandir(self.directory) as it:
+                return [entry for entry in it
+                        if entry.name.endswith(ResultCache.ENTRY_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def evict(self) -> None:
+        """Removes least recently used entries
+        until total size fits max_size"""
+
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                pass
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Removes all entries"""
+
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns cache usage statistics"""
+
+        entries = self._entries()
+        size = 0
+        for entry in entries:
+            try:
+                size += entry.stat().st_size
+            except OSError:
+                pass
+
+        requests = self.hits + self.misses
+        return {"directory": self.directory,
+                "entries": len(entries),
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests > 0 else 0.0}
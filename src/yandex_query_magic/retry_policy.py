@@ -0,0 +1,173 @@
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class CircuitBreakerOpenError(Exception):
+    """Raised instead of calling YQ API after several failed calls in a row"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"YQ API calls failed several times in a row, "
+                         f"next attempt is allowed in {retry_in:.1f} seconds")
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """Timeouts and retries of YQ HTTP calls.
+
+    Calls are grouped by operation: auth (IAM and VM metadata),
+    submit, status, info, results and stop. Each operation has its own
+    timeout, so long result pages are not cut off by short polling timeout.
+    Timeouts, connection errors, 429 and 5xx responses are retried with
+    exponential backoff with full jitter, Retry-After header is respected.
+    Query submission is not idempotent, so it is retried only if
+    the request surely was not processed: on 429 and connection failures
+    """
+
+    DEFAULT_TIMEOUTS = {
+        "auth": 1.0,
+        "submit": 10.0,
+        "status": 1.0,
+        "info": 5.0,
+        "results": 60.0,
+        "stop": 5.0,
+    }
+
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    NOT_IDEMPOTENT_OPERATIONS = frozenset(["submit"])
+
+    def __init__(self,
+                 attempts: int = 3,
+                 timeouts: Optional[dict[str, float]] = None,
+                 initial_backoff: float = 0.1,
+                 max_backoff: float = 10.0,
+                 max_retry_after: float = 60.0,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        """
+        :attempts maximum number of attempts of one call
+        :timeouts seconds per operation, overrides DEFAULT_TIMEOUTS
+        :initial_backoff maximum delay before first retry
+        :max_backoff maximum delay between retries
+        :max_retry_after maximum delay requested with Retry-After to obey
+        :failure_threshold number of failed calls in a row opening
+        circuit breaker, 0 to disable it
+        :reset_timeout seconds to reject calls while circuit is open
+        """
+
+        if attempts < 1:
+            raise ValueError("at least one attempt is required")
+
+        self.attempts = attempts
+        self.timeouts = dict(RetryPolicy.DEFAULT_TIMEOUTS)
+        if timeouts is not None:
+            self.timeouts.update(timeouts)
+
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def timeout(self, operation: str) -> float:
+        return self.timeouts[operation]
+
+    def should_retry_status(self, operation: str, status: int) -> bool:
+        if operation in RetryPolicy.NOT_IDEMPOTENT_OPERATIONS:
+            return status == 429
+
+        return status in RetryPolicy.RETRY_STATUSES
+
+    def backoff(self,
+                attempt: int,
+                retry_after: Optional[str] = None) -> float:
+        """Delay before next attempt
+        :attempt number of failed attempt, starting from 1
+        :retry_after value of Retry-After response header
+        """
+
+        delay = random.uniform(
+            0, min(self.max_backoff,
+                   self.initial_backoff * 2 ** (attempt - 1)))
+
+        requested = RetryPolicy.parse_retry_after(retry_after)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_retry_after))
+
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Parses Retry-After header given in seconds or as HTTP date"""
+
+        if value is None:
+            return None
+
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(),
+                   0.0)
+
+
+class CircuitBreaker:
+    """Rejects calls for a while after several failed calls in a row,
+    so a broken endpoint is not flooded with retries"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def check(self) -> None:
+        """Raises CircuitBreakerOpenError if calls are not allowed.
+        After reset timeout one trial call is allowed"""
+
+        if self.opened_at is None:
+            return
+
+        retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+        if retry_in > 0:
+            raise CircuitBreakerOpenError(retry_in)
+
+        # half-open: next failure opens the circuit again
+        self.opened_at = None
+        self.failures = self.failure_threshold - 1
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if 0 < self.failure_threshold <= self.failures:
+            self.opened_at = time.monotonic()
+
+
+class RetryStats:
+    """Counters of HTTP calls and retries"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.wasted_bytes = 0
+
+    def __repr__(self) -> str:
+        return (f"RetryStats(requests={self.requests}, "
+                f"retries={self.retries}, failures={self.failures}, "
+                f"wasted_bytes={self.wasted_bytes})")
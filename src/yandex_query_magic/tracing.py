@@ -0,0 +1,109 @@
+import time
+from typing import Any, Callable, Optional
+
+
+class Span:
+    """Span of traced work: HTTP request or pipeline stage.
+    This one does nothing, so tracing costs nothing when disabled"""
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = Span()
+
+
+class Tracer:
+    """Creates spans around YandexQuery HTTP requests and pipeline stages.
+
+    Span names:
+        yq.iam - obtaining new IAM token
+        yq.http - HTTP request including retries
+        yq.json_decode - decoding of response body
+        yq.submit, yq.wait, yq.fetch_results - query execution stages
+        yq.convert - conversion of one result set
+
+    Base tracer does nothing
+    """
+
+    def span(self,
+             name: str,
+             attributes: Optional[dict[str, Any]] = None) -> Span:
+        return _NOOP_SPAN
+
+
+class _CallbackSpan(Span):
+    def __init__(self, tracer: "CallbackTracer", name: str,
+                 attributes: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.started = 0.0
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        if self.tracer.on_start is not None:
+            self.tracer.on_start(self.name, self.attributes)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        duration = time.perf_counter() - self.started
+        if self.tracer.on_end is not None:
+            self.tracer.on_end(self.name, self.attributes, duration, exc_value)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class CallbackTracer(Tracer):
+    """Reports spans to callbacks:
+        on_start(name, attributes)
+        on_end(name, attributes, duration in seconds, exception or None)
+    """
+
+    def __init__(self,
+                 on_start: Optional[Callable[[str, dict[str, Any]], None]] = None,  # noqa: E501
+                 on_end: Optional[Callable[[str, dict[str, Any], float, Optional[BaseException]], None]] = None):  # noqa: E501
+        self.on_start = on_start
+        self.on_end = on_end
+
+    def span(self,
+             name: str,
+             attributes: Optional[dict[str, Any]] = None) -> Span:
+        return _CallbackSpan(self, name,
+                             {} if attributes is None else dict(attributes))
+
+
+class OpenTelemetryTracer(Tracer):
+    """Emits OpenTelemetry spans. Requires opentelemetry-api package"""
+
+    def __init__(self, tracer: Any = None):
+        """
+        :tracer opentelemetry tracer, tracer of the global tracer provider
+        by default
+        """
+
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except Exception as e:
+                raise ValueError(
+                    "opentelemetry-api must be installed to use "
+                    "OpenTelemetryTracer: %pip install opentelemetry-api"
+                ) from e
+
+            tracer = trace.get_tracer("yandex_query_magic")
+
+        self.tracer = tracer
+
+    def span(self,
+             name: str,
+             attributes: Optional[dict[str, Any]] = None) -> Span:
+        # opentelemetry spans have compatible set_attribute method
+        return self.tracer.start_as_current_span(name, attributes=attributes)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from .async_utils import retrieve_exception
+
+
+class TtlCache:
+    """Process wide cache of values with limited lifetime, e.g. IAM tokens
+    keyed by auth identity.
+
+    Values are served from cache until they expire. When a value enters
+    the refresh window it is still served, but a new one is requested
+    in background so callers never wait while value is valid
+    """
+
+    # IAM tokens live up to 12 hours, but not every auth source
+    # reports expiration time, so be conservative when it is unknown
+    DEFAULT_TTL = 3600
+
+    # start background refresh this many seconds before value expires
+    REFRESH_BEFORE_EXPIRY = 300
+
+    def __init__(self,
+                 default_ttl: float = DEFAULT_TTL,
+                 refresh_before_expiry: float = REFRESH_BEFORE_EXPIRY):
+        """
+        :default_ttl lifetime of values fetched without known lifetime
+        :refresh_before_expiry seconds before expiration to refresh value
+        in background, 0 to refresh only expired values
+        """
+
+        self.default_ttl = default_ttl
+        self.refresh_before_expiry = refresh_before_expiry
+
+        # key -> (value, monotonic expiration time)
+        self._values: Dict[Hashable, Tuple[Any, float]] = {}
+
+        # key -> task fetching new value, shared by concurrent callers
+        self._fetches: Dict[Hashable, asyncio.Task] = {}
+
+    async def get(self,
+                  key: Hashable,
+                  fetch: Callable[[], Awaitable[Tuple[Any, Optional[float]]]]) -> Any:  # noqa: E501
+        """Returns cached value or obtains new one using fetch.
+        :fetch coroutine returning value and its lifetime in seconds
+        (None if unknown)
+        """
+
+        now = time.monotonic()
+        cached = self._values.get(key, None)
+        if cached is not None:
+            value, expires_at = cached
+            if now < expires_at:
+                if expires_at - now < self.refresh_before_expiry:
+                    self._start_fetch(key, fetch)
+                return value
+
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def invalidate(self, key: Hashable, value: Optional[Any] = None) -> None:
+        """Drops cached value, e.g. token after server rejected it with 401.
+        If value is given, cache is dropped only if it still holds it"""
+
+        cached = self._values.get(key, None)
+        if cached is None:
+            return
+
+        if value is None or cached[0] == value:
+            del self._values[key]
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def _start_fetch(self,
+                     key: Hashable,
+                     fetch: Callable[[], Awaitable[Tuple[Any, Optional[float]]]]) -> asyncio.Task:  # noqa: E501
+        loop = asyncio.get_running_loop()
+
+        # tasks are bound to event loop they were created in,
+        # so fetches from other loops are not shared
+        task = self._fetches.get(key, None)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return task
+
+        # background refresh errors are not fatal: value is still valid
+        # and foreground fetch will be done after its expiration
+        task = loop.create_task(self._fetch(key, fetch))
+        task.add_done_callback(retrieve_exception)
+        self._fetches[key] = task
+        return task
+
+    async def _fetch(self,
+                     key: Hashable,
+                     fetch: Callable[[], Awaitable[Tuple[Any, Optional[float]]]]) -> Any:  # noqa: E501
+        try:
+            value, ttl = await fetch()
+            if ttl is None:
+                ttl = self.default_ttl
+
+            self._values[key] = (value, time.monotonic() + ttl)
+            return value
+        finally:
+            if self._fetches.get(key, None) is asyncio.current_task():
+                del self._fetches[key]
@@ -1,55 +1,152 @@
-from typing import Any, Optional
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, Tuple
 from .query_results import YQResults
+from .tracing import Tracer
+
+
+# fetches result set by index:
+# returns raw result set and its converted rows or None
+ResultSetLoader = Callable[[int],
+                           Awaitable[Tuple[dict[str, Any],
+                                           Optional[list[list[Any]]]]]]
 
 
 class YandexQueryResults:
     """Holds and formats query execution results"""
 
-    def __init__(self, results: list[dict[str, Any]] | dict[str, Any]):
+    def __init__(self,
+                 results: list[Optional[dict[str, Any]]] | dict[str, Any],
+                 tracer: Optional[Tracer] = None,
+                 converted_rows: Optional[list[list[Any]]] = None,
+                 loader: Optional[ResultSetLoader] = None):
+        """
+        :tracer receives yq.convert span per result set
+        :converted_rows rows of each result set converted beforehand
+        :loader coroutine function fetching result set by index.
+        Result sets which are None in results are fetched with it
+        on first access
+        """
+
         self._raw_results = results
-        self._results: Optional[list[Any]] = None
-        self._parsers: Optional[list[YQResults]] = None
+        self.tracer = Tracer() if tracer is None else tracer
+        self._loader = loader
+        self._fetches: dict[int, asyncio.Future] = {}
+
+        self._sets = results if isinstance(results, list) else [results]
+        self._converted_rows = [None] * len(self._sets)\
+            if converted_rows is None else list(converted_rows)
+        self._parsers: list[Optional[YQResults]] = [None] * len(self._sets)
+
+    @property
+    def result_set_count(self) -> int:
+        return len(self._sets)
+
+    def is_fetched(self, index: Optional[int] = None) -> bool:
+        """Checks if result set or all result sets are fetched"""
+
+        if index is not None:
+            return self._sets[index] is not None
+
+        return all(item is not None for item in self._sets)
+
+    async def fetch(self, index: Optional[int] = None) -> None:
+        """Fetches result set by index or all result sets not fetched yet.
+        Concurrent calls for the same result set share one download"""
+
+        indexes = range(0, len(self._sets)) if index is None else [index]
+        await asyncio.gather(*[self._fetch(rs_index) for rs_index in indexes
+                               if self._sets[rs_index] is None])
+
+    async def _fetch(self, index: int) -> None:
+        task = self._fetches.get(index, None)
+        if task is None:
+            task = asyncio.ensure_future(self._loader(index))
+            self._fetches[index] = task
 
-    def _init_results_cache(self):
-        results = self._raw_results
-        if not isinstance(results, list):
-            results = [results]
+        try:
+            raw_set, converted_rows = await asyncio.shield(task)
+        except BaseException:
+            # failed download is retried on next access
+            if task.done() and self._fetches.get(index, None) is task:
+                del self._fetches[index]
+            raise
 
-        parsers = []
-        results_converted = []
-        for item in results:
-            item_parser = YQResults(item)
-            results_converted.append(item_parser.results)
-            parsers.append(item_parser)
+        if self._sets[index] is None:
+            self._sets[index] = raw_set
+            self._converted_rows[index] = converted_rows
 
-        self._parsers = parsers
-        self._results = results_converted
+    def _ensure_fetched(self, index: Optional[int] = None) -> None:
+        if self.is_fetched(index):
+            return
+
+        # magics module applies nest_asyncio,
+        # so loop is run even if it is already running
+        asyncio.get_event_loop().run_until_complete(self.fetch(index))
+
+    def _parser(self, index: int) -> YQResults:
+        parser = self._parsers[index]
+        if parser is None:
+            self._ensure_fetched(index)
+            parser = YQResults(self._sets[index], self._converted_rows[index])
+            self._parsers[index] = parser
+
+        return parser
+
+    def _convert(self, index: int, convert: Callable[[YQResults], Any]) -> Any:
+        parser = self._parser(index)
+        with self.tracer.span("yq.convert",
+                              {"yq.result_index": index,
+                               "yq.rows": len(self._sets[index]["rows"])}):
+            return convert(parser)
 
     @property
     def results(self):
-        if self._results is None:
-            self._init_results_cache()
-
-        return self._results
+        self._ensure_fetched()
+        return [self._convert(rs_index, lambda parser: parser.results)
+                for rs_index in range(0, len(self._sets))]
 
     @property
     def raw_results(self):
-        return self._raw_results
+        if self._loader is None:
+            return self._raw_results
+
+        self._ensure_fetched()
+        return self._sets
 
     def to_table(self, index: Optional[int] = 0):
-        self._init_results_cache()  # initialize internal results cache
-        return self._results[index].to_table()
+        return self._convert(index, YQResults.to_table)
 
-    def to_dataframes(self, index: Optional[int] = 0):
-        self._init_results_cache()  # initialize internal results cache
+    def to_dataframes(self,
+                      index: Optional[int] = 0,
+                      dtype_backend: Optional[str] = None,
+                      decimal_as_float: bool = False):
+        """Returns DataFrame of the result set or list of DataFrames
+        of all result sets, see YQResults.to_dataframe"""
 
-        if len(self._parsers) == 0:
+        def to_dataframe(parser: YQResults) -> Any:
+            return parser.to_dataframe(dtype_backend, decimal_as_float)
+
+        if len(self._sets) == 0:
             return None
         elif index is not None:
-            return self._parsers[index].to_dataframe()
+            return self._convert(index, to_dataframe)
         else:
+            self._ensure_fetched()
             query_results = []
-            for rs_index in range(0, len(self._parsers)):
-                query_results.append(self._parsers[rs_index].to_dataframe())
+            for rs_index in range(0, len(self._sets)):
+                query_results.append(self._convert(rs_index, to_dataframe))
 
             return query_results
+
+    def to_arrow(self, index: Optional[int] = 0):
+        """Returns pyarrow Table of the result set or list of tables
+        of all result sets. Requires pyarrow package"""
+
+        if len(self._sets) == 0:
+            return None
+        elif index is not None:
+            return self._convert(index, YQResults.to_arrow)
+        else:
+            self._ensure_fetched()
+            return [self._convert(rs_index, YQResults.to_arrow)
+                    for rs_index in range(0, len(self._sets))]
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import functools
+import re
+from typing import NamedTuple, Optional
+
+
+class YqlType(NamedTuple):
+    """Parsed YQL type expression.
+
+    Int32 -> YqlType("Int32")
+    Int32? and Optional<Int32> -> YqlType("Optional", (Int32,))
+    Struct<'a':Int32,'b':Utf8> -> YqlType("Struct", (Int32, Utf8), ("a", "b"))
+    Enum<'a','b'> -> YqlType("Enum", (), ("a", "b"))
+    Tagged<Int32,'tag'> -> YqlType("Tagged", (Int32,), ("tag",))
+    Decimal(22,9) -> YqlType("Decimal", params=(22, 9))
+    """
+
+    name: str
+    args: tuple[YqlType, ...] = ()
+    names: tuple[str, ...] = ()
+    params: tuple[int, ...] = ()
+
+
+# primitive types grouped by encoding of their values in results
+INT_TYPES = frozenset(["Int8", "Int16", "Int32", "Int64",
+                       "Uint8", "Uint16", "Uint32", "Uint64"])
+
+FLOAT_TYPES = frozenset(["Float", "Double"])
+
+# values are JSON strings as is
+TEXT_TYPES = frozenset(["Utf8", "Uuid", "Json"])
+
+DATETIME_TYPES = frozenset(["Date", "Datetime", "Timestamp"])
+
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<quoted>'(?:[^'\\]|\\.)*')
+    |(?P<number>\d+)
+    |(?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<punct>[<>(),:?])
+    )""", re.VERBOSE | re.DOTALL)
+
+_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+
+def _tokenize(type_str: str) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    while position < len(type_str):
+        match = _TOKEN.match(type_str, position)
+        if match is None:
+            if type_str[position:].isspace():
+                break
+            raise ValueError(f"Unexpected character at {position} "
+                             f"in type {type_str}")
+
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+
+    return tokens
+
+
+class _Parser:
+    def __init__(self, type_str: str):
+        self.type_str = type_str
+        self.tokens = _tokenize(type_str)
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> tuple[Optional[str], Optional[str]]:
+        index = self.position + offset
+        if index < len(self.tokens):
+            return self.tokens[index]
+        return None, None
+
+    def take(self, kind: str, value: Optional[str] = None) -> str:
+        token_kind, token_value = self.peek()
+        if token_kind != kind or (value is not None and token_value != value):
+            raise ValueError(f"Expected {value or kind} at token "
+                             f"{self.position} in type {self.type_str}")
+        self.position += 1
+        return token_value
+
+    def accept(self, value: str) -> bool:
+        if self.peek() == ("punct", value):
+            self.position += 1
+            return True
+        return False
+
+    def parse(self) -> YqlType:
+        result = self.parse_type()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.peek()[1]} "
+                             f"in type {self.type_str}")
+        return result
+
+    def parse_type(self) -> YqlType:
+        name = self.take("ident")
+        args: list[YqlType] = []
+        names: list[str] = []
+        params: list[int] = []
+
+        if self.accept("<"):
+            if not self.accept(">"):
+                while True:
+                    self.parse_member(args, names)
+                    if self.accept(">"):
+                        break
+                    self.take("punct", ",")
+        elif self.accept("("):
+            while True:
+                params.append(int(self.take("number")))
+                if self.accept(")"):
+                    break
+                self.take("punct", ",")
+
+        result = YqlType(name, tuple(args), tuple(names), tuple(params))
+        if name == "Optional" and len(args) != 1:
+            raise ValueError(f"Optional must have one argument "
+                             f"in type {self.type_str}")
+
+        while self.accept("?"):
+            result = YqlType("Optional", (result,))
+
+        return result
+
+    def parse_member(self, args: list[YqlType], names: list[str]) -> None:
+        # 'name':Type, name:Type, 'name' or Type
+        kind, value = self.peek()
+        if kind == "quoted":
+            self.position += 1
+            names.append(_ESCAPE.sub(r"\1", value[1:-1]))
+            if self.accept(":"):
+                args.append(self.parse_type())
+        elif kind == "ident" and self.peek(1) == ("punct", ":"):
+            self.position += 2
+            names.append(value)
+            args.append(self.parse_type())
+        else:
+            args.append(self.parse_type())
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_type(type_str: str) -> YqlType:
+    """Parses YQL type expression as returned in result set columns
+    :raises ValueError: if type expression is malformed
+    """
+
+    return _Parser(type_str).parse()
@@ -0,0 +1,109 @@
+import pytest
+from datetime import datetime, timezone
+from decimal import Decimal
+from yandex_query_magic import YandexQueryResults
+from yandex_query_magic.arrow_conversion import arrow_column_type, \
+    column_to_array, rows_to_record_batch
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize("yql_type,arrow_type,raw,value", [
+    ("Int8", pa.int8(), 1, 1),
+    ("Uint64", pa.uint64(), 18446744073709551615, 18446744073709551615),
+    ("Bool", pa.bool_(), True, True),
+    ("Double", pa.float64(), "inf", float("inf")),
+    ("Utf8", pa.string(), "text", "text"),
+    ("String", pa.binary(), "dGV4dA==", b"text"),
+    ("Decimal(22,9)", pa.decimal128(22, 9), "1.5", Decimal("1.5")),
+    ("Decimal(22,9)", pa.decimal128(22, 9), "inf", None),
+    ("Void", pa.null(), "Void", None),
+    ("Date", pa.date32(), "2024-01-02", datetime(2024, 1, 2)),
+    ("Datetime", pa.timestamp("s", tz="UTC"), "2024-01-02T03:04:05Z",
+     datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ("Optional<Int32>", pa.int32(), [], None),
+    ("Int32?", pa.int32(), [5], 5),
+    ("List<Optional<Utf8>>", pa.list_(pa.string()), [["a"], []], ["a", None]),
+    ("Enum<'a','b'>", pa.string(), ["a"], "a"),
+    ("pgint8", pa.int64(), "12", 12),
+    ("Tuple<Int32,Utf8>", pa.string(), [1, "a"], '[1, "a"]'),
+    ("Struct<'a':Int32,'b':Utf8?>",
+     pa.struct([pa.field("a", pa.int32()), pa.field("b", pa.string())]),
+     [1, []], {"a": 1, "b": None}),
+    ("Dict<Utf8,Int64>", pa.map_(pa.string(), pa.int64()),
+     [["a", 1]], [("a", 1)]),
+])
+def test_arrow_column_type(yql_type, arrow_type, raw, value):
+    converted_type, converter = arrow_column_type(yql_type)
+
+    assert converted_type == arrow_type
+    assert converter(raw) == value
+
+
+def test_rows_to_record_batch():
+    columns = [{"name": "a", "type": "Int64"},
+               {"name": "b", "type": "Optional<String>"}]
+    batch = rows_to_record_batch(columns, [[1, ["eXE="]], [2, []]])
+
+    assert batch.num_rows == 2
+    assert batch.column(0).to_pylist() == [1, 2]
+    assert batch.column(1).to_pylist() == [b"yq", None]
+
+
+@pytest.mark.parametrize("yql_type,raw", [
+    ("Int64", [1, 2, 3]),
+    ("Optional<Uint8>", [[1], [], [3]]),
+    ("Double", [1.5, "inf", "-inf"]),
+    ("Optional<Float>", [[1.5], []]),
+    ("Optional<String>", [["eXE="], [], ["/w=="]]),
+    ("Date", ["2024-01-02", "1970-01-01"]),
+    ("Optional<Timestamp>", [["2024-02-08T19:14:27.986418Z"], []]),
+    ("Datetime", ["2024-01-02T03:04:05Z"]),
+    ("Decimal(22,9)", ["1.5", "-2"]),
+    ("List<Int32>", [[1, 2], []]),
+    ("Void", ["Void", "Void"]),
+    ("Optional<Void>", [["Void"], []]),
+    ("Decimal(22,9)", ["1.5", "inf", "-inf", "nan"]),
+])
+def test_column_to_array(yql_type, raw):
+    """Tests arrays built with casts equal ones built value by value"""
+
+    arrow_type, converter = arrow_column_type(yql_type)
+    array = column_to_array(yql_type, raw)
+
+    assert array.type == arrow_type
+    assert array.equals(pa.array([converter(value) for value in raw],
+                                 type=arrow_type))
+
+
+def test_to_arrow():
+    data = [{"columns": [{"name": "a", "type": "Int32"},
+                         {"name": "b", "type": "Optional<Utf8>"}],
+             "rows": [[1, ["x"]], [2, []]]},
+            {"columns": [{"name": "c", "type": "Timestamp"}], "rows": []}]
+    results = YandexQueryResults(data)
+
+    table = results.to_arrow()
+    assert table.schema == pa.schema([pa.field("a", pa.int32()),
+                                      pa.field("b", pa.string())])
+    assert table.to_pylist() == [{"a": 1, "b": "x"}, {"a": 2, "b": None}]
+    assert table.column("b").null_count == 1
+
+    tables = results.to_arrow(None)
+    assert len(tables) == 2
+    assert tables[1].num_rows == 0
+    assert tables[1].schema.field("c").type == pa.timestamp("us", tz="UTC")
+
+
+def test_special_values_to_arrow():
+    data = [{"columns": [{"name": "a", "type": "Void"},
+                         {"name": "b", "type": "Decimal(22,9)"}],
+             "rows": [["Void", "1.5"], ["Void", "nan"]]}]
+    results = YandexQueryResults(data)
+
+    table = results.to_arrow()
+    assert table.to_pylist() == [{"a": None, "b": Decimal("1.5")},
+                                 {"a": None, "b": None}]
+
+    dataframe = results.to_dataframes(dtype_backend="pyarrow")
+    assert dataframe["b"].isna().tolist() == [False, True]
@@ -0,0 +1,27 @@
+import dateutil.parser
+import pytest
+from yandex_query_magic.datetime_decoding import parse_datetime, \
+    parse_datetimes
+
+
+@pytest.mark.parametrize("value", [
+    "2020-01-01",
+    "2019-09-16T00:00:00Z",
+    "2024-02-08T19:14:27.986418Z",
+    "2020-01-01 10:00:00",
+    "2024-02-08T19:14:27.9864Z",
+    "20200101T101010",
+])
+def test_parse_datetime(value):
+    expected = dateutil.parser.isoparse(value)
+    parsed = parse_datetime(value)
+
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
+
+
+def test_parse_datetimes():
+    values = ["2020-01-01T00:00:00Z", None, "2024-02-08T19:14:27.9864Z"]
+    assert parse_datetimes(values) == [
+        None if value is None else dateutil.parser.isoparse(value)
+        for value in values]
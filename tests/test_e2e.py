@@ -0,0 +1,464 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import aiohttp
+import pytest
+import pytest_asyncio
+from yandex_query_magic import (YandexQuery, YandexQueryException,
+                                PollingPolicy, RetryPolicy, CallbackTracer,
+                                PageCheckpoints, RateLimiter, QueryHandle,
+                                QueryCoalescer)
+from yandex_query_magic.retry_policy import CircuitBreaker
+from .fake_yq import FakeYandexQuery, FakeResultSet
+
+
+@pytest.fixture(scope="function")
+def fake() -> FakeYandexQuery:
+    with FakeYandexQuery() as server:
+        yield server
+
+
+@pytest_asyncio.fixture(scope="function")
+async def yandex_query(fake: FakeYandexQuery,
+                       monkeypatch: pytest.MonkeyPatch) -> YandexQuery:
+    # fake servers of different tests reuse query ids
+    monkeypatch.setattr(YandexQuery, "coalescer", QueryCoalescer())
+    async with YandexQuery(**fake.urls(),
+                           polling_policy=PollingPolicy(initial_delay=0.05,
+                                                        max_delay=0.1,
+                                                        jitter=0)) as yq:
+        yq.set_service_account_key_auth(FakeYandexQuery.SA_KEY)
+        yield yq
+
+
+async def execute(yandex_query: YandexQuery, query_text: str):
+    query_id = await yandex_query.start_execute_query("folder", query_text)
+    await yandex_query.wait_results("folder", query_id,
+                                    lambda _: None, lambda _, __: None)
+    return await yandex_query.get_query_result("folder", query_id)
+
+
+@pytest.mark.asyncio
+async def test_typed_results(fake: FakeYandexQuery,
+                             yandex_query: YandexQuery):
+    """Tests submit to DataFrame path over synthetic typed results"""
+
+    fake.add_query("select typed", [FakeResultSet.typed(2500),
+                                    FakeResultSet.typed(10)],
+                   execution_time=0.2)
+
+    results = await execute(yandex_query, "select typed")
+    dataframes = results.to_dataframes(None)
+
+    assert len(dataframes) == 2
+    assert len(dataframes[0]) == 2500
+    assert list(dataframes[0]["id"]) == list(range(2500))
+    assert dataframes[0]["name"][7] == "name 7"
+    assert dataframes[0]["payload"][7] == "payload 7"
+    assert fake.requests["results"] == 4
+
+
+@pytest.mark.asyncio
+async def test_faults(fake: FakeYandexQuery, yandex_query: YandexQuery):
+    """Tests results are fetched despite server errors and throttling"""
+
+    fake.add_query("select faults", [FakeResultSet.typed(10000)])
+    fake.error_rate = 0.2
+    fake.throttle_rate = 0.2
+    yandex_query.retry_policy = RetryPolicy(attempts=10, initial_backoff=0.01)
+
+    results = await execute(yandex_query, "select faults")
+
+    assert len(results.results[0]["rows"]) == 10000
+    assert yandex_query.retry_stats.retries > 0
+
+
+@pytest.mark.asyncio
+async def test_failed_query(fake: FakeYandexQuery,
+                            yandex_query: YandexQuery):
+    """Tests failed query issues are reported"""
+
+    fake.add_query("select failed", [], status="FAILED")
+
+    with pytest.raises(YandexQueryException) as ex:
+        await execute(yandex_query, "select failed")
+
+    assert ex.value.issues == [{"message": "Fake query failed"}]
+
+
+@pytest.mark.asyncio
+async def test_vm_auth(fake: FakeYandexQuery, yandex_query: YandexQuery):
+    """Tests VM metadata endpoints of the fake"""
+
+    yandex_query.set_vm_auth()
+
+    assert await yandex_query.resolve_vm_folder_id() == "fake_folder"
+    assert await yandex_query._get_iam_token() == "fake_iam_token"
+
+
+@pytest.mark.asyncio
+async def test_tracing(fake: FakeYandexQuery, yandex_query: YandexQuery):
+    """Tests spans are reported for requests and execution stages"""
+
+    spans = []
+    yandex_query.tracer = CallbackTracer(
+        on_end=lambda name, attributes, duration, exc:
+            spans.append((name, attributes, exc)))
+
+    fake.add_query("select traced", [FakeResultSet.typed(1500)])
+    results = await execute(yandex_query, "select traced")
+    results.results
+
+    names = [name for name, _, _ in spans]
+    for name in ["yq.iam", "yq.http", "yq.json_decode", "yq.submit",
+                 "yq.wait", "yq.fetch_results", "yq.convert"]:
+        assert name in names
+
+    assert all(exc is None for _, _, exc in spans)
+
+    http = [attributes for name, attributes, _ in spans if name == "yq.http"]
+    assert {"auth", "submit", "status", "info", "results"} <=\
+        {attributes["yq.operation"] for attributes in http}
+    assert all(attributes["http.status_code"] == 200 for attributes in http)
+
+    fetch = [attributes for name, attributes, _ in spans
+             if name == "yq.fetch_results"]
+    assert fetch == [{"yq.query_id": "query0", "yq.result_sets": 1,
+                      "yq.rows": 1500}]
+
+
+@pytest.mark.asyncio
+async def test_incremental_decoding(fake: FakeYandexQuery,
+                                    yandex_query: YandexQuery):
+    """Tests results are the same when pages are decoded while received"""
+
+    fake.add_query("select incremental", [FakeResultSet.typed(2500)])
+    expected = (await execute(yandex_query, "select incremental")).raw_results
+
+    yandex_query.incremental_decoding = True
+    results = await execute(yandex_query, "select incremental")
+
+    assert results.raw_results == expected
+
+
+@pytest.mark.asyncio
+async def test_resume_from_checkpoints(fake: FakeYandexQuery,
+                                       yandex_query: YandexQuery,
+                                       tmp_path):
+    """Tests failed download of results is resumed from missing pages"""
+
+    fake.add_query("select resumable", [FakeResultSet.typed(20000)])
+    query_id = await yandex_query.start_execute_query("folder",
+                                                      "select resumable")
+    await yandex_query.wait_results("folder", query_id,
+                                    lambda _: None, lambda _, __: None)
+
+    checkpoints = PageCheckpoints(str(tmp_path))
+    yandex_query.checkpoints = checkpoints
+    yandex_query.retry_policy = RetryPolicy(attempts=1)
+    yandex_query.circuit_breaker = CircuitBreaker(0, 0)
+
+    # connection dies near the end of download
+    fake.results_error_offset = 15000
+    with pytest.raises(aiohttp.ClientResponseError):
+        await yandex_query.get_query_result("folder", query_id)
+
+    # let cancelled requests and page writes settle
+    await asyncio.sleep(0.2)
+    saved = checkpoints.pages(query_id)
+    assert 8 <= saved <= 15
+
+    fake.results_error_offset = None
+    fake.reset_stats()
+    results = await yandex_query.get_query_result("folder", query_id)
+
+    assert fake.requests["results"] == 20 - saved
+    assert [row[0] for row in results.raw_results[0]["rows"]] ==\
+        list(range(20000))
+    assert checkpoints.pages(query_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_parquet_results(fake: FakeYandexQuery,
+                               yandex_query: YandexQuery,
+                               tmp_path):
+    """Tests results are written to Parquet page by page"""
+
+    pa = pytest.importorskip("pyarrow")
+
+    fake.add_query("select parquet", [FakeResultSet.typed(2500),
+                                      FakeResultSet.typed(0)])
+    query_id = await yandex_query.start_execute_query("folder",
+                                                      "select parquet")
+    await yandex_query.wait_results("folder", query_id,
+                                    lambda _: None, lambda _, __: None)
+    expected = (await yandex_query.get_query_result("folder", query_id))\
+        .to_dataframes(None)
+
+    results = await yandex_query.get_query_result_parquet("folder",
+                                                          query_id,
+                                                          str(tmp_path))
+
+    assert results.row_counts == [2500, 0]
+    assert results.paths[0].startswith(str(tmp_path))
+
+    import pyarrow.parquet as pq
+    metadata = pq.ParquetFile(results.paths[0]).metadata
+    assert metadata.num_row_groups == 3
+
+    table = results.to_arrow()
+    assert table.schema.field("id").type == pa.int64()
+    assert table.schema.field("payload").type == pa.binary()
+    assert table.schema.field("price").type == pa.decimal128(22, 9)
+    assert table.schema.field("day").type == pa.date32()
+    assert table.schema.field("ts").type == pa.timestamp("us", tz="UTC")
+    assert table.schema.field("maybe").type == pa.int32()
+
+    dataframes = results.to_dataframes(None)
+    assert len(dataframes[1]) == 0
+    assert list(dataframes[0]["id"]) == list(expected[0]["id"])
+    assert list(dataframes[0]["name"]) == list(expected[0]["name"])
+    assert dataframes[0]["payload"][7] == b"payload 7"
+    assert dataframes[0]["maybe"].isna().sum() == 250
+
+
+@pytest.mark.asyncio
+async def test_coalesce_queries(fake: FakeYandexQuery,
+                                yandex_query: YandexQuery):
+    """Tests identical running queries share one execution and download"""
+
+    fake.add_query("select 'a  b'  from t", [FakeResultSet.typed(3000)],
+                   execution_time=0.3)
+    yandex_query.coalesce_queries = True
+
+    results = await asyncio.gather(
+        execute(yandex_query, "select 'a  b'  from t"),
+        execute(yandex_query, "select 'a  b'\n  from t;"),
+        execute(yandex_query, "select 'a  b'  from t"))
+
+    assert fake.requests["submit"] == 1
+    assert fake.requests["results"] == 3
+    assert results[0] is results[1] is results[2]
+
+    # completed query is not reused
+    await execute(yandex_query, "select 'a  b'  from t")
+    assert fake.requests["submit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_coalesce_after_failed_wait(fake: FakeYandexQuery,
+                                          yandex_query: YandexQuery):
+    """Tests query whose wait failed is not reused by identical query"""
+
+    fake.add_query("select slow", [FakeResultSet.typed(10)],
+                   execution_time=0.3)
+    yandex_query.coalesce_queries = True
+
+    query_id = await yandex_query.start_execute_query("folder", "select slow")
+    with pytest.raises(asyncio.TimeoutError):
+        await yandex_query.wait_results("folder", query_id,
+                                        lambda _: None, lambda _, __: None,
+                                        PollingPolicy(initial_delay=0.01,
+                                                      deadline=0.05))
+
+    await execute(yandex_query, "select slow")
+    assert fake.requests["submit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_coalesced_query_stopped_by_last_caller(
+        fake: FakeYandexQuery, yandex_query: YandexQuery):
+    """Tests shared query is stopped only when all callers stop it"""
+
+    fake.add_query("select shared", [FakeResultSet.typed(10)],
+                   execution_time=10)
+    yandex_query.coalesce_queries = True
+
+    first = await yandex_query.start_execute_query("folder", "select shared")
+    second = await yandex_query.start_execute_query("folder",
+                                                    "select shared")
+    assert first == second
+
+    await first.stop()
+    assert fake.requests.get("stop", 0) == 0
+    assert await yandex_query._get_query_status("folder", second) ==\
+        "RUNNING"
+
+    await second.stop()
+    assert fake.requests["stop"] == 1
+    assert await second.wait() == "ABORTED_BY_USER"
+
+
+@pytest.mark.asyncio
+async def test_run_many_stops_timed_out_query(fake: FakeYandexQuery,
+                                              yandex_query: YandexQuery):
+    """Tests query exceeding polling deadline is stopped"""
+
+    fake.add_query("select slow", [FakeResultSet.typed(10)],
+                   execution_time=10)
+
+    results = await yandex_query.run_many(
+        "folder", ["select slow"],
+        polling_policy=PollingPolicy(initial_delay=0.01, deadline=0.05))
+
+    assert isinstance(results[0], asyncio.TimeoutError)
+    assert fake.requests["stop"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_class",
+                         [ThreadPoolExecutor, ProcessPoolExecutor])
+async def test_pipelined_conversion(fake: FakeYandexQuery,
+                                    yandex_query: YandexQuery,
+                                    executor_class):
+    """Tests pages converted in executor give the same results"""
+
+    fake.add_query("select pipelined", [FakeResultSet.typed(2500),
+                                        FakeResultSet.typed(10)])
+    expected = (await execute(yandex_query, "select pipelined")).results
+
+    with executor_class(max_workers=2) as executor:
+        yandex_query.conversion_executor = executor
+        results = await execute(yandex_query, "select pipelined")
+
+    assert results.results == expected
+    assert results.raw_results[0]["rows"][7][0] == 7
+
+
+@pytest.mark.asyncio
+async def test_failed_download_cancels_conversions(fake: FakeYandexQuery,
+                                                   yandex_query: YandexQuery):
+    """Tests queued page conversions are cancelled if download fails"""
+
+    class RecordingExecutor(ThreadPoolExecutor):
+        def __init__(self):
+            super().__init__(max_workers=1)
+            self.futures = []
+
+        def submit(self, *args, **kwargs):
+            future = super().submit(*args, **kwargs)
+            self.futures.append(future)
+            return future
+
+    fake.add_query("select failing", [FakeResultSet.typed(20000)])
+    query_id = await yandex_query.start_execute_query("folder",
+                                                      "select failing")
+    await yandex_query.wait_results("folder", query_id,
+                                    lambda _: None, lambda _, __: None)
+
+    yandex_query.retry_policy = RetryPolicy(attempts=1)
+    yandex_query.circuit_breaker = CircuitBreaker(0, 0)
+    # pages before the failing one are downloaded and queued first
+    yandex_query.max_concurrent_fetches = 2
+    fake.results_error_offset = 15000
+
+    with RecordingExecutor() as executor:
+        # conversions are queued behind blocked worker
+        blocked = threading.Event()
+        executor.submit(blocked.wait)
+        yandex_query.conversion_executor = executor
+        try:
+            with pytest.raises(aiohttp.ClientResponseError):
+                await yandex_query.get_query_result("folder", query_id)
+        finally:
+            blocked.set()
+
+    assert len(executor.futures) > 1
+    assert all(future.cancelled() for future in executor.futures[1:])
+
+
+@pytest.mark.asyncio
+async def test_warm_up(fake: FakeYandexQuery, yandex_query: YandexQuery):
+    """Tests warm up obtains auth in advance"""
+
+    yandex_query.set_vm_auth()
+    await yandex_query.warm_up(resolve_folder_id=True)
+    assert fake.requests["metadata"] == 2
+
+    fake.add_query("select warm", [FakeResultSet.typed(10)])
+    folder_id = await yandex_query.resolve_vm_folder_id()
+    query_id = await yandex_query.start_execute_query(folder_id,
+                                                      "select warm")
+    await yandex_query.wait_results(folder_id, query_id,
+                                    lambda _: None, lambda _, __: None)
+    await yandex_query.get_query_result(folder_id, query_id)
+
+    assert fake.requests["metadata"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter(fake: FakeYandexQuery,
+                            yandex_query: YandexQuery,
+                            monkeypatch: pytest.MonkeyPatch):
+    """Tests result pages are fetched no faster than rate limit"""
+
+    limiter = RateLimiter(rates={"results": 40}, bursts={"results": 1})
+    monkeypatch.setattr(YandexQuery, "rate_limiter", limiter)
+
+    fake.add_query("select limited", [FakeResultSet.typed(20000)])
+    query_id = await yandex_query.start_execute_query("folder",
+                                                      "select limited")
+    await yandex_query.wait_results("folder", query_id,
+                                    lambda _: None, lambda _, __: None)
+
+    started = time.monotonic()
+    await yandex_query.get_query_result("folder", query_id)
+
+    assert time.monotonic() - started >= 19 / 40
+    assert limiter.stats["results"].calls == 20
+    assert limiter.stats["results"].wait_time > 0
+    assert limiter.stats["submit"].calls == 1
+
+
+@pytest.mark.asyncio
+async def test_query_handle(fake: FakeYandexQuery,
+                            yandex_query: YandexQuery):
+    """Tests query handle requests query information once"""
+
+    fake.add_query("select handle", [FakeResultSet.typed(10),
+                                     FakeResultSet.typed(5)],
+                   execution_time=0.2)
+
+    handle = await yandex_query.start_execute_query("folder", "select handle")
+    assert isinstance(handle, QueryHandle)
+    assert handle == handle.query_id
+    assert handle.folder_id == "folder"
+
+    assert await handle.wait() == "COMPLETED"
+    assert handle.finished
+    assert await handle.wait() == "COMPLETED"
+
+    info = await handle.info()
+    assert len(handle.result_sets) == 2
+    results = await handle.results()
+
+    assert await handle.info() is info
+    assert len(results.results[1]["rows"]) == 5
+    assert fake.requests["info"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lazy_results(fake: FakeYandexQuery,
+                            yandex_query: YandexQuery):
+    """Tests result sets are fetched on first access only"""
+
+    fake.add_query("select lazy", [FakeResultSet.typed(1500),
+                                   FakeResultSet.typed(3000)])
+
+    handle = await yandex_query.start_execute_query("folder", "select lazy")
+    await handle.wait()
+    results = await handle.results(lazy=True)
+
+    assert results.result_set_count == 2
+    assert fake.requests.get("results", 0) == 0
+
+    await results.fetch(0)
+    assert len(results.to_dataframes(0)) == 1500
+    assert fake.requests["results"] == 2
+    assert not results.is_fetched()
+
+    await asyncio.gather(results.fetch(1), results.fetch())
+    assert fake.requests["results"] == 5
+    assert results.is_fetched()
+    assert [len(df) for df in results.to_dataframes(None)] == [1500, 3000]
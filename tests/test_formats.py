@@ -1,6 +1,10 @@
+import importlib.util
+import pytest
 import pandas as pd
 from datetime import datetime, timezone, timedelta
+from decimal import Decimal
 from yandex_query_magic import YandexQueryResults
+from yandex_query_magic.query_results import YQResults
 
 
 def test_int32():
@@ -83,3 +87,118 @@ def test_timestamp_microseconds():
                                                      microsecond=986418,
                                                      tzinfo=timezone(
                                                          offset=timedelta(seconds=0)))]))  # noqa
+
+
+def test_nested_containers():
+    data = [{'rows': [[[[1, 2], [["YQ==", 3]]],
+                       [5, ["eXE="]],
+                       ["Two", "b"]]],
+             'columns': [{'name': 'column0',
+                          'type': 'Tuple<List<Int32>,Dict<String,Int64>>'},
+                         {'name': 'column1',
+                          'type': "Struct<'a':Int32,'b':String?>"},
+                         {'name': 'column2',
+                          'type': "Variant<'One':Int32,'Two':Utf8>"}]}]
+
+    row = YandexQueryResults(data).results[0]["rows"][0]
+    assert row == [([1, 2], {"a": 3}), {"a": 5, "b": "yq"}, "b"]
+
+
+def test_columnar_conversion():
+    """Tests DataFrame converted column at a time equals one
+    built from converted rows"""
+
+    columns = [("Int64", 1, -5), ("Uint64", 2**64 - 1, 3),
+               ("Bool", True, False), ("Double", "inf", 1.5),
+               ("String", "eXE=", "/w=="), ("Utf8", "a", "b"),
+               ("Date", "2020-01-01", "2105-12-31"),
+               ("Timestamp", "2024-02-08T19:14:27.986418Z",
+                "2019-09-16T00:00:00Z"),
+               ("Optional<Int32>", [1], []), ("Optional<Double>", [], []),
+               ("Optional<Bool>", [True], []), ("Optional<Utf8>", [], ["x"]),
+               ("Optional<Datetime>", ["2020-01-01T00:00:00Z"], []),
+               ("Decimal(22,9)", "1.5", "2"),
+               ("List<Int32>", [1, 2], [])]
+
+    data = {'columns': [{'name': f"column{index}", 'type': column[0]}
+                        for index, column in enumerate(columns)],
+            'rows': [[column[1] for column in columns],
+                     [column[2] for column in columns]]}
+
+    parsed = YQResults(data).to_dataframe()
+    expected = pd.DataFrame(YQResults(data).results["rows"],
+                            columns=[f"column{index}"
+                                     for index in range(len(columns))])
+
+    pd.testing.assert_frame_equal(parsed, expected)
+    assert parsed["column4"][1] == b"\xff"
+    assert list(parsed.dtypes[0:4]) == ["int64", "uint64", "bool", "float64"]
+
+    empty = YQResults({'columns': data['columns'], 'rows': []})
+    assert empty.to_dataframe().equals(pd.DataFrame([], columns=expected.columns))  # noqa
+
+
+def test_nullable_dtypes():
+    columns = [("Int64", 1, 2), ("Optional<Uint32>", [1], []),
+               ("Optional<Bool>", [], [True]), ("Double", "inf", 1.5),
+               ("Optional<Utf8>", ["a"], []), ("String", "eXE=", "YQ=="),
+               ("Optional<Date>", ["2020-01-01"], []),
+               ("Timestamp", "2024-02-08T19:14:27.986418Z",
+                "2019-09-16T00:00:00Z"),
+               ("Decimal(22,9)", "1.5", "-2"),
+               ("Optional<Decimal(22,9)>", [], ["0.25"])]
+    data = {'columns': [{'name': f"column{index}", 'type': column[0]}
+                        for index, column in enumerate(columns)],
+            'rows': [[column[1] for column in columns],
+                     [column[2] for column in columns]]}
+
+    parsed = YQResults(data).to_dataframe("numpy_nullable")
+    assert [str(dtype) for dtype in parsed.dtypes] == [
+        "Int64", "UInt32", "boolean", "Float64", "string", "string",
+        "datetime64[us]", "datetime64[us, UTC]", "object", "object"]
+    assert parsed["column1"].isna().tolist() == [False, True]
+    assert parsed["column8"][0] == Decimal("1.5")
+    if importlib.util.find_spec("pyarrow") is not None:
+        assert parsed.dtypes["column4"].storage == "pyarrow"
+
+    parsed = YQResults(data).to_dataframe("numpy_nullable",
+                                          decimal_as_float=True)
+    assert str(parsed.dtypes["column8"]) == "Float64"
+    assert parsed["column9"].isna().tolist() == [True, False]
+
+    parsed = YQResults(data).to_dataframe(decimal_as_float=True)
+    assert parsed["column9"].tolist()[1] == 0.25
+    assert str(parsed.dtypes["column8"]) == "float64"
+
+
+def test_pyarrow_dtypes():
+    pytest.importorskip("pyarrow")
+
+    data = [{'columns': [{'name': 'a', 'type': 'Optional<Int32>'},
+                         {'name': 'b', 'type': 'Decimal(22,9)'}],
+             'rows': [[[1], "1.5"], [[], "2"]]}]
+
+    parsed = YandexQueryResults(data).to_dataframes(dtype_backend="pyarrow",
+                                                    decimal_as_float=True)
+    assert [str(dtype) for dtype in parsed.dtypes] == ["int32[pyarrow]",
+                                                       "double[pyarrow]"]
+    assert parsed["a"].isna().tolist() == [False, True]
+
+
+def test_row_decoder():
+    types = ("Int32", "Optional<Double>", "Optional<Optional<Utf8>>",
+             "String", "Optional<List<Decimal(22,9)>>", "Enum<'a','b'>",
+             "Tagged<Float,'t'>", "Unknown<<")
+    decode = YQResults._row_decoder(types)
+    assert YQResults._row_decoder(types) is decode
+
+    rows = [[1, ["inf"], [["x"]], "eXE=", [["1.5"]], ["b"], 0.5, [7]],
+            [2, [], [[]], "YQ==", [], ["a"], "nan", 8]]
+    data = {'columns': [{'name': f"column{index}", 'type': column_type}
+                        for index, column_type in enumerate(types)],
+            'rows': rows}
+
+    converted = YQResults(data).results["rows"]
+    assert converted[0] == [1, float("inf"), "x", "yq", [Decimal("1.5")],
+                            "b", 0.5, [7]]
+    assert converted[1][0:6] == [2, None, None, "a", None, "a"]
@@ -0,0 +1,70 @@
+import json
+import math
+import pytest
+from yandex_query_magic.json_decoding import (JsonDecoder, OrjsonDecoder,
+                                              RowsStreamParser,
+                                              default_json_decoder)
+
+
+PAGE = {"columns": [{"name": "rows", "type": "Utf8"},
+                    {"name": "b", "type": "List<Int32>"}],
+        "rows": [["a],[\"]", [1, 2]],
+                 ["rows", []],
+                 ["\\\"],", [[3]]],
+                 ["", [4]]],
+        "truncated": False}
+
+
+def decoders() -> list[JsonDecoder]:
+    return [JsonDecoder(), default_json_decoder()]
+
+
+@pytest.mark.parametrize("decoder", decoders())
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 100000])
+def test_rows_stream_parser(decoder: JsonDecoder,
+                            indent: int,
+                            chunk_size: int):
+    """Tests page split into chunks at any position is decoded"""
+
+    body = json.dumps(PAGE, indent=indent).encode()
+    parser = RowsStreamParser(decoder)
+    for offset in range(0, len(body), chunk_size):
+        parser.feed(body[offset:offset + chunk_size])
+
+    assert parser.close() == PAGE
+
+
+def test_rows_stream_parser_decodes_while_receiving():
+    rows = [[i, f"value {i}"] for i in range(1000)]
+    body = json.dumps({"columns": [], "rows": rows}).encode()
+
+    parser = RowsStreamParser(JsonDecoder())
+    parser.feed(body[:len(body) // 2])
+    assert 0 < len(parser.rows) < 1000
+    assert parser.rows == rows[:len(parser.rows)]
+
+    parser.feed(body[len(body) // 2:])
+    assert parser.close()["rows"] == rows
+
+
+@pytest.mark.parametrize("body", [b'{"message": "rows"}',
+                                  b'{"rows": [], "columns": []}',
+                                  b'{"columns": [], "rows": [[1]]}'])
+def test_rows_stream_parser_other_documents(body: bytes):
+    parser = RowsStreamParser(JsonDecoder())
+    parser.feed(body)
+    assert parser.close() == json.loads(body)
+
+
+def test_rows_stream_parser_incomplete():
+    parser = RowsStreamParser(JsonDecoder())
+    parser.feed(b'{"rows": [[1], [2], [3')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_orjson_decoder_fallback():
+    pytest.importorskip("orjson")
+
+    assert math.isnan(OrjsonDecoder().loads(b'{"rows": [[NaN]]}')["rows"][0][0])  # noqa: E501
@@ -0,0 +1,35 @@
+import pytest
+from itertools import islice
+from yandex_query_magic import PollingPolicy
+
+
+def test_backoff():
+    policy = PollingPolicy(initial_delay=0.5, fast_polls=2,
+                           multiplier=2, max_delay=3, jitter=0)
+
+    delays = list(islice(policy.delays(), 6))
+    assert delays == [0.5, 0.5, 1, 2, 3, 3]
+
+
+def test_jitter():
+    policy = PollingPolicy(initial_delay=1, fast_polls=100,
+                           max_delay=1, jitter=0.2)
+
+    for delay in islice(policy.delays(), 100):
+        assert 0.8 <= delay <= 1.2
+
+
+def test_presets():
+    interactive = PollingPolicy.interactive()
+    batch = PollingPolicy.batch()
+
+    assert interactive.initial_delay < batch.initial_delay
+    assert interactive.max_delay < batch.max_delay
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        PollingPolicy(initial_delay=2, max_delay=1)
+
+    with pytest.raises(ValueError):
+        PollingPolicy(jitter=1)
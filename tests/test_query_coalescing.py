@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from yandex_query_magic import QueryCoalescer
+
+
+def test_normalize():
+    assert QueryCoalescer.normalize("  select 1,\n\t2 ;\n") == "select 1, 2"
+    assert QueryCoalescer.normalize("select 'a  b', \"c\n d\", `e  f`") ==\
+        "select 'a  b', \"c\n d\", `e  f`"
+    assert QueryCoalescer.normalize("select 'a  b'") !=\
+        QueryCoalescer.normalize("select 'a b'")
+
+    # comments and @@ literals are not collapsed
+    assert QueryCoalescer.normalize("select 1 -- c\nfrom t") !=\
+        QueryCoalescer.normalize("select 1 -- c from t")
+    assert QueryCoalescer.normalize("select 1 --c\n  from  t") ==\
+        "select 1 --c\n from t"
+    assert QueryCoalescer.normalize("select /* a  b */ 1") !=\
+        QueryCoalescer.normalize("select /* a b */ 1")
+    assert QueryCoalescer.normalize("select @@a  b@@") !=\
+        QueryCoalescer.normalize("select @@a b@@")
+    assert QueryCoalescer.normalize("select @@a 'b@@,  'c'") ==\
+        "select @@a 'b@@, 'c'"
+
+
+@pytest.mark.asyncio
+async def test_failed_submit_is_not_shared():
+    coalescer = QueryCoalescer()
+    submits = []
+
+    async def submit():
+        submits.append(1)
+        await asyncio.sleep(0.01)
+        if len(submits) == 1:
+            raise ValueError("submit failed")
+        return "query_id"
+
+    results = await asyncio.gather(
+        coalescer.submit("folder", "select 1", submit),
+        coalescer.submit("folder", "select 1", submit),
+        return_exceptions=True)
+
+    assert len(submits) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+    assert await coalescer.submit("folder", "select 1", submit) == "query_id"
+    assert await coalescer.submit("folder", "select  1", submit) == "query_id"
+    assert len(submits) == 2
+    assert coalescer.coalesced_submits == 2
+
+    coalescer.finish("query_id")
+    assert await coalescer.submit("folder", "select 1", submit) == "query_id"
+    assert len(submits) == 3
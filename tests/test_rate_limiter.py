@@ -0,0 +1,54 @@
+import asyncio
+import time
+import pytest
+from yandex_query_magic import RateLimiter
+from yandex_query_magic.rate_limiter import TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # following tokens are reserved one after another
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_validation():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0, burst=1)
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, burst=0.5)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(rates={"status": 20}, bursts={"status": 1})
+
+    started = time.monotonic()
+    await asyncio.gather(*[limiter.acquire("info") for _ in range(5)])
+    await limiter.acquire("status")
+    elapsed = time.monotonic() - started
+
+    assert elapsed == pytest.approx(0.25, abs=0.05)
+    assert limiter.stats["status"].calls == 6
+    assert limiter.stats["status"].delayed == 5
+    assert limiter.stats["status"].max_wait == pytest.approx(0.2, abs=0.05)
+
+    # other groups and authentication are not limited
+    assert await limiter.acquire("results") == 0
+    assert await limiter.acquire("auth") == 0
+    assert limiter.stats["results"].calls == 1
+
+
+def test_rate_limiter_groups():
+    limiter = RateLimiter()
+    with pytest.raises(ValueError):
+        limiter.set_rate("info", 10)
+
+    limiter.set_rate("submit", 2)
+    limiter.set_rate("submit", None)
+    limiter.reset_stats()
+    assert limiter.stats["submit"].calls == 0
@@ -0,0 +1,65 @@
+import os
+import time
+from yandex_query_magic import ResultCache
+
+
+RESULTS = [{"columns": [{"name": "a", "type": "Int32"}],
+            "rows": [[1], [2]]}]
+
+
+def test_put_get(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    assert cache.get("folder", "select 1") is None
+    cache.put("folder", "select 1", RESULTS)
+
+    assert cache.get("folder", "select 1") == RESULTS
+    assert cache.get("other_folder", "select 1") is None
+    assert cache.get("folder", "select 2") is None
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["hit_rate"] == 0.25
+
+
+def test_ttl(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60)
+
+    cache.put("folder", "select 1", RESULTS, ttl=-1)
+    cache.put("folder", "select 2", RESULTS)
+
+    assert cache.get("folder", "select 1") is None
+    assert cache.get("folder", "select 2") == RESULTS
+
+    # expired entry is removed
+    assert cache.stats()["entries"] == 1
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    for i in range(3):
+        cache.put("folder", f"select {i}", RESULTS)
+        path = cache._entry_path(ResultCache.make_key("folder", f"select {i}"))
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    # reading makes entry the most recently used one
+    assert cache.get("folder", "select 0") == RESULTS
+
+    cache.max_size = cache.stats()["size"] - 1
+    cache.evict()
+
+    assert cache.get("folder", "select 0") == RESULTS
+    assert cache.get("folder", "select 1") is None
+    assert cache.get("folder", "select 2") == RESULTS
+
+
+def test_clear(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("folder", "select 1", RESULTS)
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.get("folder", "select 1") is None
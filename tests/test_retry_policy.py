@@ -0,0 +1,56 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from yandex_query_magic import RetryPolicy, CircuitBreakerOpenError
+from yandex_query_magic.retry_policy import CircuitBreaker
+
+
+def test_backoff():
+    policy = RetryPolicy(initial_backoff=1, max_backoff=3)
+
+    for attempt, limit in [(1, 1), (2, 2), (3, 3), (10, 3)]:
+        for _ in range(100):
+            assert 0 <= policy.backoff(attempt) <= limit
+
+
+def test_retry_after():
+    policy = RetryPolicy(initial_backoff=0, max_retry_after=10)
+
+    assert policy.backoff(1, "5") == 5
+    assert policy.backoff(1, "100") == 10
+    assert policy.backoff(1, "bad value") == 0
+
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 <= RetryPolicy.parse_retry_after(format_datetime(retry_at)) <= 30
+
+
+def test_retry_statuses():
+    policy = RetryPolicy()
+
+    assert policy.should_retry_status("results", 429)
+    assert policy.should_retry_status("results", 503)
+    assert not policy.should_retry_status("results", 404)
+    assert policy.should_retry_status("submit", 429)
+    assert not policy.should_retry_status("submit", 500)
+
+
+def test_timeouts():
+    policy = RetryPolicy(timeouts={"results": 300})
+
+    assert policy.timeout("results") == 300
+    assert policy.timeout("status") == RetryPolicy.DEFAULT_TIMEOUTS["status"]
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.check()
+
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    with pytest.raises(CircuitBreakerOpenError):
+        breaker.check()
@@ -0,0 +1,33 @@
+import pytest
+from yandex_query_magic.yql_types import YqlType, parse_type
+
+INT32 = YqlType("Int32")
+UTF8 = YqlType("Utf8")
+
+
+@pytest.mark.parametrize("type_str, expected", [
+    ("Int32", INT32),
+    ("Int32?", YqlType("Optional", (INT32,))),
+    ("Optional<Int32>", YqlType("Optional", (INT32,))),
+    ("Int32??", YqlType("Optional", (YqlType("Optional", (INT32,)),))),
+    ("Decimal(22,9)", YqlType("Decimal", params=(22, 9))),
+    ("Enum<'a','b'>", YqlType("Enum", names=("a", "b"))),
+    ("Tagged<Int32,'tag'>", YqlType("Tagged", (INT32,), ("tag",))),
+    ("Struct<>", YqlType("Struct")),
+    ("Struct<'a':Int32, 'b\\'c':Utf8?>",
+     YqlType("Struct", (INT32, YqlType("Optional", (UTF8,))), ("a", "b'c"))),
+    ("Variant<One:Int32,Two:Utf8>",
+     YqlType("Variant", (INT32, UTF8), ("One", "Two"))),
+    ("Tuple<List<Int32>,Dict<Utf8,Int32>>",
+     YqlType("Tuple", (YqlType("List", (INT32,)),
+                       YqlType("Dict", (UTF8, INT32))))),
+])
+def test_parse_type(type_str, expected):
+    assert parse_type(type_str) == expected
+
+
+@pytest.mark.parametrize("type_str", ["", "List<Int32", "Int32>",
+                                      "Optional<>", "Decimal(22,)", "Int32$"])
+def test_malformed_type(type_str):
+    with pytest.raises(ValueError):
+        parse_type(type_str)